@@ -3,6 +3,7 @@ import glob
 import yaml
 import re
 import shutil
+import time
 from typing import Dict, List, Optional
 from fnmatch import fnmatch
 
@@ -165,10 +166,36 @@ def _load_top_level_brands_yml() -> Optional[Dict[str, Dict]]:
         return brands_cfg
     return None
 
+# Cached get_brands() result: brand files change rarely, so re-scanning the
+# brands directory is skipped for BRANDS_CACHE_TTL seconds unless brands.yml
+# or the directory itself has been modified since.
+BRANDS_CACHE_TTL = 60
+_brands_cache = {'t': 0.0, 'stamp': None, 'v': None}
+
+def _brands_stamp() -> tuple:
+    stamps = []
+    for path in (IMPORTS_BRANDS_DIR, os.path.join(IMPORTS_BRANDS_DIR, 'brands.yml')):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
 def get_brands() -> List[Dict]:
     """
     Returns a list of brand configurations discovered in imports/brands.
+    Results are cached; see BRANDS_CACHE_TTL.
     """
+    stamp = _brands_stamp()
+    cached = _brands_cache['v']
+    if cached is not None and _brands_cache['stamp'] == stamp and time.time() - _brands_cache['t'] < BRANDS_CACHE_TTL:
+        return list(cached)
+
+    brands = _load_brands()
+    _brands_cache.update(t=time.time(), stamp=stamp, v=brands)
+    return list(brands)
+
+def _load_brands() -> List[Dict]:
     # Prefer top-level brands.yml if present
     top_cfg = _load_top_level_brands_yml()
     if top_cfg:
@@ -1,4 +1,5 @@
 import os
+import shutil
 
 # Resolve project paths
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -7,11 +8,18 @@ PROJECT_ROOT = os.path.abspath(os.path.join(APP_DIR, '..'))
 IMPORTS_BRANDS_DIR = os.path.join(PROJECT_ROOT, 'imports', 'brands')
 OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'output')
 UI_DIR = os.path.join(APP_DIR, 'ui')
+ASSET_CACHE_DIR = os.path.join(PROJECT_ROOT, 'cache', 'assets')  # pre-scaled overlay PNGs
+PROBE_CACHE_DIR = os.path.join(PROJECT_ROOT, 'cache', 'probe')  # ffprobe results as JSON
 
 # FFmpeg/FFprobe binaries (override with environment variables if needed)
+# Resolved to absolute paths once, so spawns don't search PATH every time
 FFMPEG_BIN = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+FFMPEG_BIN = shutil.which(FFMPEG_BIN) or FFMPEG_BIN
 FFPROBE_BIN = os.environ.get('FFPROBE_PATH', 'ffprobe')
+FFPROBE_BIN = shutil.which(FFPROBE_BIN) or FFPROBE_BIN
 
 # Ensure necessary directories exist at runtime
 os.makedirs(IMPORTS_BRANDS_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+os.makedirs(PROBE_CACHE_DIR, exist_ok=True)
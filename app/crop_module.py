@@ -7,6 +7,8 @@ import subprocess
 import json
 from typing import Tuple, Dict, Optional
 from .config import FFMPEG_BIN, FFPROBE_BIN
+from .ffmpeg_utils import PROBE_TIMEOUT
+
 
 class CropEditor:
     """
@@ -21,6 +23,13 @@ class CropEditor:
         '16:9': (16, 9),    # Landscape (YouTube)
     }
     
+    # Clockwise rotation in degrees -> ffmpeg filter
+    ROTATION_FILTERS = {
+        90: 'transpose=1',
+        180: 'transpose=1,transpose=1',
+        270: 'transpose=2',
+    }
+    
     def __init__(self, video_path: str, output_dir: str):
         self.video_path = video_path
         self.output_dir = output_dir
@@ -31,32 +40,33 @@ class CropEditor:
         self.height = self.video_info['height']
         
     def _probe_video(self) -> Dict:
-        """Get video dimensions and properties"""
-        try:
-            cmd = [
-                FFPROBE_BIN, '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height,duration,r_frame_rate',
-                '-of', 'json',
-                self.video_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            data = json.loads(result.stdout)
-            stream = data['streams'][0]
-            
-            # Parse frame rate
-            fps_parts = stream.get('r_frame_rate', '30/1').split('/')
-            fps = int(fps_parts[0]) / int(fps_parts[1]) if len(fps_parts) == 2 else 30
-            
-            return {
-                'width': int(stream['width']),
-                'height': int(stream['height']),
-                'duration': float(stream.get('duration', 0)),
-                'fps': fps
-            }
-        except Exception as e:
-            # Fallback defaults
-            return {'width': 1080, 'height': 1920, 'duration': 0, 'fps': 30}
+        """
+        Get video dimensions and properties
+        
+        Raises if ffprobe fails or times out: a crop computed for guessed
+        dimensions would cut the wrong region (or stream-copy an uncropped video)
+        """
+        cmd = [
+            FFPROBE_BIN, '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,duration,r_frame_rate',
+            '-of', 'json',
+            self.video_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=PROBE_TIMEOUT)
+        data = json.loads(result.stdout)
+        stream = data['streams'][0]
+        
+        # Parse frame rate
+        fps_parts = stream.get('r_frame_rate', '30/1').split('/')
+        fps = int(fps_parts[0]) / int(fps_parts[1]) if len(fps_parts) == 2 and int(fps_parts[1]) else 30
+        
+        return {
+            'width': int(stream['width']),
+            'height': int(stream['height']),
+            'duration': float(stream.get('duration', 0)),
+            'fps': fps
+        }
     
     def calculate_crop_dimensions(self, aspect_ratio: str = '9:16') -> Tuple[int, int]:
         """Calculate crop dimensions based on aspect ratio"""
@@ -124,6 +134,24 @@ class CropEditor:
         h = crop_settings['height']
         rotation = crop_settings.get('rotation', 0)
         
+        if (w, h) == (self.width, self.height) and not rotation:
+            # Source already has the target shape - copy the video instead of
+            # decoding and re-encoding it (the brand export re-encodes it
+            # anyway). Audio is still converted to AAC as below: the export
+            # stream-copies it into MP4, which rejects e.g. Vorbis or PCM
+            cmd = [
+                FFMPEG_BIN, '-y',
+                '-i', self.video_path,
+                '-map', '0:v:0',
+                '-map', '0:a?',
+                '-c:v', 'copy',
+                '-c:a', 'aac',
+                '-b:a', '128k',
+                output_path
+            ]
+            subprocess.run(cmd, check=True, capture_output=True)
+            return output_path
+        
         # Build ffmpeg filter
         filters = []
         
@@ -131,12 +159,8 @@ class CropEditor:
         filters.append(f'crop={w}:{h}:{x}:{y}')
         
         # Apply rotation if needed
-        if rotation == 90:
-            filters.append('transpose=1')
-        elif rotation == 180:
-            filters.append('transpose=1,transpose=1')
-        elif rotation == 270:
-            filters.append('transpose=2')
+        if rotation in self.ROTATION_FILTERS:
+            filters.append(self.ROTATION_FILTERS[rotation])
         
         filter_str = ','.join(filters)
         
@@ -158,6 +182,11 @@ class CropEditor:
     
     def get_crop_metadata(self, crop_settings: Dict) -> Dict:
         """Return crop metadata for downstream use"""
+        # cropped_dimensions are those of the output file, after any rotation
+        width, height = crop_settings['width'], crop_settings['height']
+        if crop_settings.get('rotation', 0) in (90, 270):
+            width, height = height, width
+        
         return {
             'crop': crop_settings,
             'original_dimensions': {
@@ -165,8 +194,8 @@ class CropEditor:
                 'height': self.height
             },
             'cropped_dimensions': {
-                'width': crop_settings['width'],
-                'height': crop_settings['height']
+                'width': width,
+                'height': height
             }
         }
 
@@ -0,0 +1,102 @@
+"""
+FFmpeg helpers shared by the CLI pipeline and the portal
+
+Standard library only and no imports from app.config, so the portal can use
+these without loading the pipeline's dependencies.
+"""
+import re
+import subprocess
+import threading
+from collections import deque
+from typing import Callable, List, Optional, Sequence, Tuple
+
+PROBE_TIMEOUT = 5  # seconds; ffprobe only reads the container header
+STDERR_READ_SIZE = 64 * 1024  # bytes per stderr read; also caps one kept line
+_LINE_BREAK = re.compile(rb'[\r\n]')
+
+
+def pick_encoder_args(ffmpeg_bin: str, candidates: Sequence[Tuple[str, List[str]]],
+                      fallback: List[str]) -> List[str]:
+    """
+    FFmpeg video encoder args for the first working hardware encoder in
+    candidates, otherwise fallback (returned as-is, so callers can test
+    `is fallback`)
+
+    FFmpeg builds list hardware encoders whether or not the device exists, so
+    each candidate must pass a one-frame test encode. Callers cache the result.
+    """
+    try:
+        listing = subprocess.run([ffmpeg_bin, '-hide_banner', '-encoders'],
+                                 capture_output=True, text=True, timeout=10).stdout
+    except (subprocess.SubprocessError, OSError):
+        return fallback
+
+    for encoder, args in candidates:
+        if encoder not in listing:
+            continue
+        test_cmd = [
+            ffmpeg_bin, '-hide_banner', '-v', 'error',
+            '-f', 'lavfi', '-i', 'color=black:s=256x256',
+            '-frames:v', '1', '-c:v', encoder, *args, '-pix_fmt', 'yuv420p',
+            '-f', 'null', '-'
+        ]
+        try:
+            if subprocess.run(test_cmd, capture_output=True, timeout=15).returncode == 0:
+                return ['-c:v', encoder, *args]
+        except (subprocess.SubprocessError, OSError):
+            continue
+    return fallback
+
+
+def _stderr_lines(stream):
+    """
+    Yield FFmpeg stderr lines (bytes, newline-terminated) split on both \\r and \\n
+
+    FFmpeg ends its progress reports with \\r, so splitting on \\n alone would
+    build an encode's whole progress output into one line. A line longer than
+    STDERR_READ_SIZE keeps only its end.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read1(STDERR_READ_SIZE)
+        if not chunk:
+            break
+        *lines, pending = _LINE_BREAK.split(pending + chunk)
+        pending = pending[-STDERR_READ_SIZE:]
+        for line in lines:
+            if line:
+                yield line + b'\n'
+    if pending:
+        yield pending + b'\n'
+
+
+def run_ffmpeg(cmd: List[str], timeout: float, tail_lines: int,
+               on_spawn: Optional[Callable[[subprocess.Popen], None]] = None
+               ) -> Tuple[int, deque, bool]:
+    """
+    Run an FFmpeg command; returns (returncode, stderr tail lines as bytes, timed_out)
+
+    stderr is read as FFmpeg writes it, split into lines on \\r or \\n, and only
+    the last tail_lines are kept (FFmpeg reports the error last), so memory
+    stays flat however long the encode runs. A watchdog timer kills FFmpeg
+    past timeout seconds. on_spawn, if given, is called with the process right after it starts.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    watchdog = threading.Timer(timeout, kill_on_timeout)
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        if on_spawn:
+            on_spawn(process)
+        stderr_tail = deque(_stderr_lines(process.stderr), maxlen=tail_lines)
+        returncode = process.wait()
+    finally:
+        watchdog.cancel()
+        process.stderr.close()
+    return returncode, stderr_tail, timed_out.is_set()
@@ -8,6 +8,24 @@ import json
 from typing import Tuple, Dict
 from .config import FFMPEG_BIN, PROJECT_ROOT
 
+LOGOS_CLEAN_DIR = os.path.join(PROJECT_ROOT, 'imports', 'brands', 'wtf_orchestrator', 'logos_clean')
+
+# File name -> path for LOGOS_CLEAN_DIR, rebuilt when the directory's mtime changes
+_logos_clean_index = {'mtime': None, 'files': {}}
+
+def _cleaned_logos() -> Dict[str, str]:
+    """Index of cleaned logos (one scandir per directory change instead of a stat per lookup)"""
+    try:
+        mtime = os.stat(LOGOS_CLEAN_DIR).st_mtime_ns
+    except OSError:
+        return {}
+    if _logos_clean_index['mtime'] != mtime:
+        with os.scandir(LOGOS_CLEAN_DIR) as entries:
+            files = {entry.name: entry.path for entry in entries if entry.is_file()}
+        _logos_clean_index['files'] = files
+        _logos_clean_index['mtime'] = mtime
+    return _logos_clean_index['files']
+
 class LogoEditor:
     """
     Interactive logo editor with pinch-to-zoom and drag support
@@ -44,10 +62,8 @@ class LogoEditor:
             return None
         
         # Check for cleaned logo first
-        logo_name = os.path.basename(logo)
-        cleaned_path = os.path.join(PROJECT_ROOT, 'imports', 'brands', 'wtf_orchestrator', 'logos_clean', logo_name)
-        
-        if os.path.exists(cleaned_path):
+        cleaned_path = _cleaned_logos().get(os.path.basename(logo))
+        if cleaned_path:
             return cleaned_path
         
         # Fall back to original
@@ -101,7 +101,8 @@ class WTFOrchestrator:
                 brands,
                 logo_settings,
                 self.output_dir,
-                video_id
+                video_id,
+                video_info=crop_metadata['cropped_dimensions']
             )
             results['outputs'] = output_paths
             print(f"  ✓ Exported {len(output_paths)} video(s)")
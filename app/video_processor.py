@@ -3,12 +3,184 @@ Video Processor - Apply template, logo, and watermark with adaptive opacity
 Handles multi-brand export with safe zones and brightness-based watermark adjustment
 """
 import os
+import sys
+import shutil
 import subprocess
 import json
-from typing import Dict, List, Optional
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from PIL import Image
 import numpy as np
-from .config import FFMPEG_BIN, FFPROBE_BIN, PROJECT_ROOT
+from .config import FFMPEG_BIN, FFPROBE_BIN, PROJECT_ROOT, ASSET_CACHE_DIR, PROBE_CACHE_DIR
+from .ffmpeg_utils import PROBE_TIMEOUT, pick_encoder_args, run_ffmpeg
+
+# H.264 encoders for brand exports: first working hardware encoder wins,
+# otherwise libx264 at the original quality settings
+HARDWARE_ENCODERS = [
+    ('h264_nvenc', ['-preset', 'p5', '-rc', 'vbr', '-cq', '19']),
+    ('h264_qsv', ['-preset', 'medium', '-global_quality', '20']),
+    ('h264_videotoolbox', ['-b:v', '8M']),
+    ('h264_v4l2m2m', ['-b:v', '8M']),
+]
+SOFTWARE_ENCODER_ARGS = ['-c:v', 'libx264', '-crf', '18', '-preset', 'medium']
+
+EXPORT_TIMEOUT = 600  # seconds before a brand export's FFmpeg is killed
+STDERR_TAIL_LINES = 200  # FFmpeg stderr lines kept for error reports
+FUSED_EXPORT_MAX = 4  # brands encoded from one decode of the video
+PROBE_CACHE_MAX_ENTRIES = 256  # probe results kept on disk
+ASSET_CACHE_MAX_ENTRIES = 256  # pre-scaled overlay PNGs kept on disk
+
+
+@lru_cache(maxsize=1)
+def video_encoder_args() -> List[str]:
+    """FFmpeg video encoder args, preferring a working hardware H.264 encoder (detected once per process)"""
+    return pick_encoder_args(FFMPEG_BIN, HARDWARE_ENCODERS, SOFTWARE_ENCODER_ARGS)
+
+
+def video_decoder_args() -> List[str]:
+    """
+    FFmpeg input args for decoding exports: -hwaccel auto when a hardware
+    encoder is in use (so the host has a GPU), nothing otherwise
+    
+    FFmpeg falls back to software decoding if the codec has no hardware path.
+    """
+    return [] if video_encoder_args() is SOFTWARE_ENCODER_ARGS else ['-hwaccel', 'auto']
+
+
+def prescaled_asset(image_path: str, width: int, height: Optional[int] = None,
+                    opacity: Optional[float] = None) -> Optional[str]:
+    """
+    Path of a copy of image_path resized to width x height (height None keeps the
+    aspect ratio) with its alpha multiplied by opacity, cached in ASSET_CACHE_DIR
+    
+    Overlays then take the PNG as-is instead of scaling it (and applying the
+    opacity) in every ffmpeg run. Returns None if the image can't be prepared.
+    """
+    try:
+        st = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{st.st_size}|{width}|{height}|{opacity}"
+        cached_path = os.path.join(ASSET_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.png')
+        try:
+            # Mark it recently used so pruning keeps it
+            os.utime(cached_path)
+            return cached_path
+        except FileNotFoundError:
+            pass
+        
+        with Image.open(image_path) as img:
+            img = img.convert('RGBA')
+            if height is None:
+                height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        if opacity is not None:
+            img.putalpha(img.getchannel('A').point(lambda a: round(a * opacity)))
+        
+        # Write then rename, so a concurrent run never reads a partial file
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp_path, 'PNG', compress_level=1)
+        os.replace(tmp_path, cached_path)
+        _prune_cache_dir(ASSET_CACHE_DIR, ASSET_CACHE_MAX_ENTRIES)
+        return cached_path
+    except Exception as e:
+        print(f"  Asset pre-scale failed for {image_path}: {e}")
+        return None
+
+
+@lru_cache(maxsize=256)
+def _probe_video_info(video_path: str, mtime_ns: int, size: int) -> Dict:
+    """
+    ffprobe width/height/duration of a video
+    
+    Cached by (path, mtime, size), so a file is probed once until it changes -
+    in memory, and as JSON in PROBE_CACHE_DIR so other processes (the next CLI
+    run, the portal) reuse it too. Failures raise and are not cached
+    """
+    key = f"{os.path.abspath(video_path)}|{mtime_ns}|{size}"
+    cached_path = os.path.join(PROBE_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.json')
+    try:
+        with open(cached_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    
+    cmd = [
+        FFPROBE_BIN, '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,duration',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=PROBE_TIMEOUT)
+    data = json.loads(result.stdout)
+    stream = data['streams'][0]
+    
+    info = {
+        'width': int(stream['width']),
+        'height': int(stream['height']),
+        'duration': float(stream.get('duration', 0))
+    }
+    try:
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, cached_path)
+        _prune_cache_dir(PROBE_CACHE_DIR, PROBE_CACHE_MAX_ENTRIES)
+    except OSError:
+        pass
+    return info
+
+
+def _prune_cache_dir(directory: str, max_entries: int) -> None:
+    """Keep the max_entries most recently written (or used) files in a cache
+    directory (every crop or export is a new file, and brand images change,
+    so old entries are rarely hit again)"""
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+    if len(entries) <= max_entries:
+        return
+    entries.sort()
+    for _, path in entries[:-max_entries]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _run_ffmpeg(cmd: List[str]) -> None:
+    """Run an export ffmpeg command; raises CalledProcessError (stderr = the tail) on failure"""
+    returncode, stderr_tail, _ = run_ffmpeg(cmd, EXPORT_TIMEOUT, STDERR_TAIL_LINES)
+    
+    if returncode != 0:
+        print("FFmpeg error:")
+        sys.stdout.writelines("  " + line.decode(errors='replace').rstrip() + "\n"
+                              for line in stderr_tail if line.strip())
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=b''.join(stderr_tail))
+
+
+def _run_export(cmd: List[str], output_paths: List[str]) -> None:
+    """
+    Run an export whose outputs are written as <path>.part, then rename them
+    into place - an existing output is always a complete video, never a
+    half-written or failed encode
+    """
+    try:
+        _run_ffmpeg(cmd)
+        for path in output_paths:
+            os.replace(path + '.part', path)
+    finally:
+        for path in output_paths:
+            try:
+                os.remove(path + '.part')
+            except OSError:
+                pass
+
 
 class VideoProcessor:
     """
@@ -19,35 +191,30 @@ class VideoProcessor:
     WATERMARK_OPACITY_MIN = 0.10  # 10% for bright videos
     WATERMARK_OPACITY_MAX = 0.20  # 20% for dark videos
     
-    def __init__(self, video_path: str, output_dir: str = 'exports'):
+    # watermark_position -> overlay x/y expressions, {m} = safe-zone margin in px
+    WATERMARK_POSITIONS = {
+        'bottom-right': ('W-w-{m}', 'H-h-{m}'),
+        'bottom-left': ('{m}', 'H-h-{m}'),
+        'top-right': ('W-w-{m}', '{m}'),
+        'top-left': ('{m}', '{m}'),
+    }
+    
+    def __init__(self, video_path: str, output_dir: str = 'exports',
+                 video_info: Optional[Dict] = None):
         self.video_path = video_path
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
         
-        self.video_info = self._probe_video()
+        # Callers that already know the dimensions (e.g. from the crop stage) skip ffprobe
+        self.video_info = dict(video_info) if video_info else self._probe_video()
         self.brightness = None  # Lazy loaded
+        self._brand_dirs = set()  # brand output directories already created
     
     def _probe_video(self) -> Dict:
-        """Get video properties"""
-        try:
-            cmd = [
-                FFPROBE_BIN, '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height,duration',
-                '-of', 'json',
-                self.video_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            data = json.loads(result.stdout)
-            stream = data['streams'][0]
-            
-            return {
-                'width': int(stream['width']),
-                'height': int(stream['height']),
-                'duration': float(stream.get('duration', 0))
-            }
-        except:
-            return {'width': 1080, 'height': 1920, 'duration': 0}
+        """Get video properties (raises if the video can't be probed - overlays
+        sized for a guessed resolution would be wrong)"""
+        st = os.stat(self.video_path)
+        return dict(_probe_video_info(self.video_path, st.st_mtime_ns, st.st_size))
     
     def calculate_video_brightness(self) -> float:
         """
@@ -66,7 +233,7 @@ class VideoProcessor:
                 '-ss', '1',  # 1 second in
                 '-i', self.video_path,
                 '-vframes', '1',
-                '-vf', 'scale=320:240',  # Small size for speed
+                '-vf', 'scale=320:240:flags=fast_bilinear',  # Small and cheap - only averaged
                 temp_frame
             ]
             
@@ -106,15 +273,27 @@ class VideoProcessor:
         
         return opacity
     
-    def build_filter_complex(self, brand_config: Dict, logo_settings: Optional[Dict] = None) -> str:
+    def build_filter_complex(self, brand_config: Dict, logo_settings: Optional[Dict] = None,
+                             source: str = '0:v', first_input: int = 1,
+                             out_label: str = 'vout') -> Tuple[Optional[str], List[str]]:
         """
         Build ffmpeg filter_complex for overlays
         
         Order:
-        1. Scale template to video size
+        1. Scale template to video size (images are pre-scaled via prescaled_asset)
         2. Overlay template
         3. Overlay logo (if settings provided)
         4. Overlay watermark with adaptive opacity
+        
+        Overlay images are extra ffmpeg inputs (first_input, first_input + 1, ...)
+        rather than movie= sources, so the whole chain is one filtergraph. Each
+        image is a single frame; overlay repeats its last frame for the rest of
+        the video. The chain reads the video from [source] and ends at
+        [out_label]; its internal labels are prefixed with out_label, so several
+        brands' chains can share one graph.
+        
+        Returns:
+            (filter_complex or None, overlay image paths in input order)
         """
         assets = brand_config.get('assets', {})
         options = brand_config.get('options', {})
@@ -123,14 +302,25 @@ class VideoProcessor:
         height = self.video_info['height']
         
         filters = []
-        inputs = ['0:v']  # Start with video input
+        inputs = [source]  # Start with video input
+        overlay_inputs = []  # Image inputs, ffmpeg input index = position + first_input
+        label = f"{out_label}_"
         
-        # 1. Load and scale template
+        def next_input():
+            return first_input + len(overlay_inputs) - 1
+        
+        # 1. Load and scale template (pre-scaled PNG when possible)
         template_path = os.path.join(PROJECT_ROOT, 'imports', 'brands', assets.get('template', ''))
-        if os.path.exists(template_path):
-            filters.append(f"movie='{template_path}',scale={width}:{height}[template]")
-            filters.append(f"[{inputs[-1]}][template]overlay=0:0[v1]")
-            inputs.append('v1')
+        if os.path.isfile(template_path):
+            scaled_path = prescaled_asset(template_path, width, height)
+            if scaled_path:
+                overlay_inputs.append(scaled_path)
+                filters.append(f"[{inputs[-1]}][{next_input()}:v]overlay=0:0[{label}v1]")
+            else:
+                overlay_inputs.append(template_path)
+                filters.append(f"[{next_input()}:v]scale={width}:{height}[{label}template]")
+                filters.append(f"[{inputs[-1]}][{label}template]overlay=0:0[{label}v1]")
+            inputs.append(f"{label}v1")
         
         # 2. Overlay logo (if settings provided)
         if logo_settings and logo_settings.get('logo_path'):
@@ -141,14 +331,21 @@ class VideoProcessor:
                 logo_w = logo_settings['logo_settings']['width']
                 logo_h = logo_settings['logo_settings']['height']
                 
-                filters.append(f"movie='{logo_path}',scale={logo_w}:{logo_h}[logo]")
-                filters.append(f"[{inputs[-1]}][logo]overlay={logo_x}:{logo_y}[v2]")
-                inputs.append('v2')
+                scaled_path = prescaled_asset(logo_path, logo_w, logo_h)
+                if scaled_path:
+                    overlay_inputs.append(scaled_path)
+                    filters.append(f"[{inputs[-1]}][{next_input()}:v]overlay={logo_x}:{logo_y}[{label}v2]")
+                else:
+                    overlay_inputs.append(logo_path)
+                    filters.append(f"[{next_input()}:v]scale={logo_w}:{logo_h}[{label}logo]")
+                    filters.append(f"[{inputs[-1]}][{label}logo]overlay={logo_x}:{logo_y}[{label}v2]")
+                inputs.append(f"{label}v2")
         
         # 3. Overlay watermark with adaptive opacity
         watermark_path = os.path.join(PROJECT_ROOT, 'imports', 'brands', assets.get('watermark', ''))
-        if os.path.exists(watermark_path):
-            opacity = self.calculate_adaptive_watermark_opacity()
+        if os.path.isfile(watermark_path):
+            # Rounded so pre-scaled watermarks are reused across similar videos
+            opacity = round(self.calculate_adaptive_watermark_opacity(), 2)
             wm_scale = options.get('watermark_scale', 0.25)
             wm_width = int(width * wm_scale)
             
@@ -156,26 +353,25 @@ class VideoProcessor:
             safe_margin = int(width * self.SAFE_ZONE_PERCENT)
             wm_position = options.get('watermark_position', 'bottom-right')
             
-            if wm_position == 'bottom-right':
-                wm_x = f"W-w-{safe_margin}"
-                wm_y = f"H-h-{safe_margin}"
-            elif wm_position == 'bottom-left':
-                wm_x = safe_margin
-                wm_y = f"H-h-{safe_margin}"
-            elif wm_position == 'top-right':
-                wm_x = f"W-w-{safe_margin}"
-                wm_y = safe_margin
-            elif wm_position == 'top-left':
-                wm_x = safe_margin
-                wm_y = safe_margin
-            else:
-                wm_x = f"W-w-{safe_margin}"
-                wm_y = f"H-h-{safe_margin}"
+            wm_x, wm_y = self.WATERMARK_POSITIONS.get(wm_position, self.WATERMARK_POSITIONS['bottom-right'])
+            wm_x = wm_x.format(m=safe_margin)
+            wm_y = wm_y.format(m=safe_margin)
             
-            filters.append(f"movie='{watermark_path}',scale={wm_width}:-1,format=rgba,colorchannelmixer=aa={opacity}[watermark]")
-            filters.append(f"[{inputs[-1]}][watermark]overlay={wm_x}:{wm_y}")
+            scaled_path = prescaled_asset(watermark_path, wm_width, opacity=opacity)
+            if scaled_path:
+                overlay_inputs.append(scaled_path)
+                filters.append(f"[{inputs[-1]}][{next_input()}:v]overlay={wm_x}:{wm_y}[{label}v3]")
+            else:
+                overlay_inputs.append(watermark_path)
+                filters.append(f"[{next_input()}:v]scale={wm_width}:-1,format=rgba,colorchannelmixer=aa={opacity}[{label}watermark]")
+                filters.append(f"[{inputs[-1]}][{label}watermark]overlay={wm_x}:{wm_y}[{label}v3]")
+            inputs.append(f"{label}v3")
         
-        return ';'.join(filters) if filters else None
+        if not filters:
+            return None, overlay_inputs
+        # Name the last stage's output so it can be -map'ped (null is a passthrough)
+        filters.append(f"[{inputs[-1]}]null[{out_label}]")
+        return ';'.join(filters), overlay_inputs
     
     def process_brand(self, brand_config: Dict, logo_settings: Optional[Dict] = None, 
                      video_id: str = 'video') -> str:
@@ -190,45 +386,113 @@ class VideoProcessor:
         Returns:
             Path to processed video
         """
-        brand_name = brand_config.get('name', 'brand')
-        output_filename = f"{brand_name}_{video_id}.mp4"
-        output_path = os.path.join(self.output_dir, brand_name, output_filename)
-        
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        output_path = self._brand_output_path(brand_config, video_id)
         
         # Build filter complex
-        filter_complex = self.build_filter_complex(brand_config, logo_settings)
+        filter_complex, overlay_inputs = self.build_filter_complex(brand_config, logo_settings)
         
         if not filter_complex:
             # No overlays - just copy
-            import shutil
             shutil.copy2(self.video_path, output_path)
             return output_path
         
         # Run ffmpeg
         cmd = [
-            FFMPEG_BIN, '-y',
+            FFMPEG_BIN, '-y', '-nostats', '-hide_banner',
+            *video_decoder_args(),
             '-i', self.video_path,
+            *[arg for path in overlay_inputs for arg in ('-i', path)],
             '-filter_complex', filter_complex,
-            '-c:v', 'libx264',
-            '-crf', '18',
-            '-preset', 'medium',
+            *self._export_output_args('vout', output_path)
+        ]
+        
+        _run_export(cmd, [output_path])
+        return output_path
+    
+    def _brand_output_path(self, brand_config: Dict, video_id: str) -> str:
+        brand_name = brand_config.get('name', 'brand')
+        output_filename = f"{brand_name}_{video_id}.mp4"
+        brand_dir = os.path.join(self.output_dir, brand_name)
+        
+        # Combined exports and their per-brand retries ask for the same brands
+        if brand_dir not in self._brand_dirs:
+            os.makedirs(brand_dir, exist_ok=True)
+            self._brand_dirs.add(brand_dir)
+        return os.path.join(brand_dir, output_filename)
+    
+    @staticmethod
+    def _export_output_args(video_label: str, output_path: str) -> List[str]:
+        """ffmpeg output options for one brand export: the filtered video plus the source audio
+        
+        Written to output_path + '.part'; _run_export renames it into place.
+        """
+        return [
+            '-map', f'[{video_label}]',
+            '-map', '0:a?',
+            *video_encoder_args(),
+            '-pix_fmt', 'yuv420p',
             '-c:a', 'copy',
-            output_path
+            '-f', 'mp4',
+            output_path + '.part'
         ]
+    
+    def process_brands_fused(self, brands: List[Dict], logo_settings: Optional[Dict] = None,
+                             video_id: str = 'video') -> List[str]:
+        """
+        Process video for several brands in one ffmpeg run
         
-        try:
-            subprocess.run(cmd, check=True, capture_output=True)
-            return output_path
-        except subprocess.CalledProcessError as e:
-            print(f"FFmpeg error: {e.stderr.decode()}")
-            raise
+        The video is decoded once and split into each brand's overlay chain and
+        encoder, instead of being decoded again for every brand. Brands without
+        overlays are copied as in process_brand. Raises if the run fails.
+        
+        Returns:
+            Output video paths, in brand order
+        """
+        output_paths = []
+        copied = set()  # brands without overlays, already written by process_brand
+        graphs = []
+        overlay_inputs = []
+        output_args = []
+        
+        for brand in brands:
+            branch = len(graphs)
+            filter_complex, inputs = self.build_filter_complex(
+                brand, logo_settings, source=f's{branch}',
+                first_input=len(overlay_inputs) + 1, out_label=f'out{branch}')
+            if not filter_complex:
+                output_paths.append(self.process_brand(brand, logo_settings, video_id))
+                copied.add(output_paths[-1])
+                continue
+            output_path = self._brand_output_path(brand, video_id)
+            graphs.append(filter_complex)
+            overlay_inputs.extend(inputs)
+            output_args.extend(self._export_output_args(f'out{branch}', output_path))
+            output_paths.append(output_path)
+        
+        if graphs:
+            split = f"[0:v]split={len(graphs)}" + ''.join(f"[s{i}]" for i in range(len(graphs)))
+            cmd = [
+                FFMPEG_BIN, '-y', '-nostats', '-hide_banner',
+                *video_decoder_args(),
+                '-i', self.video_path,
+                *[arg for path in overlay_inputs for arg in ('-i', path)],
+                '-filter_complex', ';'.join([split, *graphs]),
+                *output_args
+            ]
+            _run_export(cmd, [path for path in output_paths if path not in copied])
+        return output_paths
     
     def process_multiple_brands(self, brands: List[Dict], logo_settings: Optional[Dict] = None,
                                video_id: str = 'video') -> List[str]:
         """
         Process video for multiple brands
         
+        Brands are exported FUSED_EXPORT_MAX at a time from a single decode
+        (process_brands_fused); if a combined run fails, its brands are retried
+        one at a time so a single bad brand doesn't take the others down. The
+        retries stay serial: the combined run may have failed for memory, and
+        separate runs each bring their own decoder and filtergraph.
+        
         Args:
             brands: List of brand configurations
             logo_settings: Logo settings (same for all brands if provided)
@@ -239,22 +503,36 @@ class VideoProcessor:
         """
         output_paths = []
         
-        for brand in brands:
-            brand_name = brand.get('display_name', brand.get('name', 'Unknown'))
-            print(f"  Processing {brand_name}...")
+        for start in range(0, len(brands), FUSED_EXPORT_MAX):
+            batch = brands[start:start + FUSED_EXPORT_MAX]
+            if len(batch) > 1:
+                names = ', '.join(b.get('display_name', b.get('name', 'Unknown')) for b in batch)
+                print(f"  Processing {names}...")
+                try:
+                    for output_path in self.process_brands_fused(batch, logo_settings, video_id):
+                        output_paths.append(output_path)
+                        print(f"    ✓ Exported to {output_path}")
+                    continue
+                except Exception as e:
+                    print(f"    ✗ Combined export failed ({e}), retrying one brand at a time")
             
-            try:
-                output_path = self.process_brand(brand, logo_settings, video_id)
-                output_paths.append(output_path)
-                print(f"    ✓ Exported to {output_path}")
-            except Exception as e:
-                print(f"    ✗ Failed: {e}")
+            for brand in batch:
+                brand_name = brand.get('display_name', brand.get('name', 'Unknown'))
+                print(f"  Processing {brand_name}...")
+                
+                try:
+                    output_path = self.process_brand(brand, logo_settings, video_id)
+                    output_paths.append(output_path)
+                    print(f"    ✓ Exported to {output_path}")
+                except Exception as e:
+                    print(f"    ✗ Failed: {e}")
         
         return output_paths
 
 
 def process_video(video_path: str, brands: List[Dict], logo_settings: Optional[Dict] = None,
-                 output_dir: str = 'exports', video_id: str = 'video') -> List[str]:
+                 output_dir: str = 'exports', video_id: str = 'video',
+                 video_info: Optional[Dict] = None) -> List[str]:
     """
     Convenience function to process video for multiple brands
     
@@ -264,9 +542,10 @@ def process_video(video_path: str, brands: List[Dict], logo_settings: Optional[D
         logo_settings: Logo position/size settings
         output_dir: Output directory
         video_id: Video identifier
+        video_info: Known width/height of video_path, to skip probing it
     
     Returns:
         List of output video paths
     """
-    processor = VideoProcessor(video_path, output_dir)
+    processor = VideoProcessor(video_path, output_dir, video_info)
     return processor.process_multiple_brands(brands, logo_settings, video_id)
@@ -5,7 +5,9 @@ import os
 import sys
 
 # Add app to path
-sys.path.insert(0, os.path.dirname(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
 
 from app.orchestrator import orchestrate
 from app.brand_loader import get_brands
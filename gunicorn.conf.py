@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration for the WatchTheFall Portal
+
+Start with: gunicorn -c gunicorn.conf.py run_portal:app
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+
+# One process: conversion/fetch job status, the conversion queue and the caches
+# live in process memory, so a second worker would answer polls for jobs it
+# never saw (and double RAM on the 512MB free tier). Threads give concurrency
+# instead - status polls and downloads are served while a fetch is running.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('WTF_GUNICORN_THREADS', '8'))
+
+# Import the app in the master so startup errors fail the deploy immediately.
+# Background threads (conversion worker, log writer, janitor) start lazily in
+# the worker process, so nothing is lost across the fork.
+preload_app = True
+
+# gthread workers heartbeat independently of requests; this only bounds a
+# stuck worker. No max_requests - recycling the worker would drop queued jobs.
+timeout = 120
+graceful_timeout = 120
@@ -1,44 +1,179 @@
 """
 WatchTheFall Portal - Flask Application
 """
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, url_for
 import os
-import uuid
-from werkzeug.utils import secure_filename
+import logging
+import secrets
+from werkzeug.utils import secure_filename, safe_join
+from urllib.parse import quote
 import subprocess
-import tempfile
+import json
+import io
+import shutil
 import threading
+import queue
+import signal
 import time
-try:
-    from yt_dlp import YoutubeDL
-except ImportError:
-    YoutubeDL = None
+import traceback
+import hashlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from .config import (
-    SECRET_KEY, PORTAL_AUTH_KEY, OUTPUT_DIR,
-    MAX_UPLOAD_SIZE, BRANDS_DIR
+    SECRET_KEY, PORTAL_AUTH_KEY, OUTPUT_DIR, TEMP_DIR,
+    MAX_UPLOAD_SIZE, BRANDS_DIR, MAX_QUEUED_CONVERSIONS, CONVERSION_WORKERS,
+    MAX_CONCURRENT_FFMPEG, FFMPEG_THREADS, FFMPEG_MAX_MEMORY_MB,
+    ALLOWED_EXTENSIONS, WATERMARK_EXTENSIONS, UPLOAD_CHUNK_SIZE,
+    FFMPEG_BIN, FFPROBE_BIN, USE_X_SENDFILE, X_ACCEL_REDIRECT_PREFIX
 )
 from .database import log_event
+from .janitor import sweep as sweep_outputs, ensure_janitor
+from .logging_setup import setup_logging
+from app.ffmpeg_utils import pick_encoder_args, run_ffmpeg
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# orjson (C) for the polled endpoints and fetch parsing; stdlib json otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# resource.prlimit caps FFmpeg's memory (Linux only)
+try:
+    import resource
+except ImportError:
+    resource = None
 
 # Instagram cookies file path
 # Use /tmp directory which is guaranteed writable on Render
-import tempfile
 IG_COOKIES_PATH = '/tmp/ig_cookies.txt'
 
+# yt-dlp is imported on the first fetch - it is large and the other routes never use it
+YoutubeDL = None
+
+# aria2c opens several connections per download; per-connection CDN throttling
+# otherwise caps yt-dlp's built-in downloader well below link speed
+ARIA2C_AVAILABLE = shutil.which('aria2c') is not None
+ARIA2C_ARGS = ['-x', '8', '-s', '8', '-k', '1M']
+
+# Downloads may be cached for an hour; a rewritten output gets a new ETag
+DOWNLOAD_MAX_AGE = 3600
+
+# Shared pool for fetch downloads (also caps concurrent downloads across requests).
+# Each pool thread keeps one YoutubeDL and reuses it while its options are
+# unchanged - building one loads every extractor - without sharing an
+# instance between concurrent extractions.
+fetch_executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix='fetch')
+_ydl_local = threading.local()
+
 app = Flask(__name__, 
             template_folder='templates',
             static_folder='static',
             static_url_path='/portal/static')
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+
+# Bounded conversion queue drained by CONVERSION_WORKERS threads - one FFmpeg
+# process per worker (default 1 for Render free tier 512MB RAM). A full queue
+# is rejected with 503 instead of spawning another thread per request.
+conversion_queue = queue.Queue(maxsize=MAX_QUEUED_CONVERSIONS)
+_conversion_workers = []
+_conversion_worker_lock = threading.Lock()
+CONVERSION_TIMEOUT = 300  # seconds before a conversion's FFmpeg is killed
+STDERR_TAIL_LINES = 20  # FFmpeg stderr lines kept for failure reports
+FETCH_JOB_TTL = 3600  # seconds a finished async fetch stays pollable
+# stderr text FFmpeg prints when an allocation fails (ENOMEM, e.g. past FFMPEG_MAX_MEMORY_MB)
+OUT_OF_MEMORY_MARKERS = (b'Cannot allocate memory', b'Out of memory')
+_encode_slots = threading.BoundedSemaphore(MAX_CONCURRENT_FFMPEG)
+_conversion_submit_lock = threading.Lock()  # duplicate check + job registration
+
+# Inputs already in these codecs are remuxed into MP4 instead of re-encoded
+# (None = stream absent; a silent H.264 clip still remuxes). The pixel format
+# must match too - 4:2:2/4:4:4 or 10-bit H.264 won't play on most phones.
+STREAM_COPY_VIDEO_CODECS = {'h264'}
+STREAM_COPY_AUDIO_CODECS = {'aac', None}
+STREAM_COPY_PIX_FMTS = {'yuv420p'}
 
-# Global conversion lock - only one FFmpeg process at a time (Render free tier 512MB RAM)
-conversion_lock = threading.Lock()
-conversion_in_progress = {'active': False, 'start_time': None}
+# H.264 encoders for conversions: first working hardware encoder wins,
+# otherwise libx264 at its fastest preset. zerolatency and a single reference
+# frame with no B-frames/lookahead keep x264's frame buffers small - most of
+# its RSS on the 512MB tier
+HARDWARE_ENCODERS = [
+    ('h264_nvenc', ['-preset', 'p4', '-rc', 'vbr', '-cq', '28']),
+    ('h264_qsv', ['-preset', 'veryfast', '-global_quality', '28']),
+    ('h264_videotoolbox', ['-b:v', '4M']),
+    ('h264_v4l2m2m', ['-b:v', '4M']),
+]
+SOFTWARE_ENCODER_ARGS = [
+    '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency,fastdecode', '-crf', '28',
+    '-x264-params', 'ref=1:bframes=0:rc-lookahead=0',
+]
+
+# Extension sets as '.ext' tuples for a single str.endswith check
+_ALLOWED_SUFFIXES = tuple('.' + ext.lower() for ext in ALLOWED_EXTENSIONS)
+_WATERMARK_SUFFIXES = tuple('.' + ext.lower() for ext in WATERMARK_EXTENSIONS)
 
 # Job status dictionary for async watermark conversions
 watermark_jobs = {}
 
+# Job status dictionary for async fetches ({"async": true} on /api/videos/fetch)
+fetch_jobs = {}
+
+def _load_youtube_dl():
+    """Import yt-dlp's YoutubeDL on first use; None if yt-dlp isn't installed"""
+    global YoutubeDL
+    if YoutubeDL is None:
+        try:
+            from yt_dlp import YoutubeDL as _YoutubeDL
+        except ImportError:
+            return None
+        YoutubeDL = _YoutubeDL
+    return YoutubeDL
+
+def _youtube_dl_key(ydl_opts, cookies_mtime):
+    """Cache key for a YoutubeDL: its options plus the cookies file version"""
+    return (repr(sorted(ydl_opts.items())), cookies_mtime)
+
+def _get_youtube_dl(ydl_opts, key):
+    """This thread's YoutubeDL, rebuilt when key (from _youtube_dl_key) changes"""
+    ydl = getattr(_ydl_local, 'ydl', None)
+    if ydl is None or _ydl_local.key != key:
+        # The stale instance is dropped, not close()d: close() saves its cookie
+        # jar to cookiefile, which would overwrite newly uploaded cookies (or
+        # recreate deleted ones) and bump the mtime other threads key on
+        ydl = YoutubeDL(ydl_opts)
+        _ydl_local.ydl = ydl
+        _ydl_local.key = key
+    return ydl
+
+def ojsonify(obj, status=200):
+    """jsonify() built with orjson when available"""
+    if orjson is None:
+        response = jsonify(obj)
+        response.status_code = status
+        return response
+    return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def _request_json():
+    """Parse the request body as JSON regardless of Content-Type; None if it isn't JSON"""
+    body = request.get_data(cache=False)
+    try:
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:
+        return None
+
+def _file_size(path):
+    """Size of a file in bytes, or None if it doesn't exist (single stat call)"""
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+
 # ============================================================================
 # FRONTEND ROUTES
 # ============================================================================
@@ -72,36 +207,33 @@ def test_page():
 def upload_instagram_cookies():
     """Upload Instagram cookies file"""
     try:
-        print(f"[IG COOKIES] Upload request received")
-        print(f"[DEBUG] Expected cookies path: {IG_COOKIES_PATH}")
-        print(f"[DEBUG] exists: {os.path.exists(IG_COOKIES_PATH)}")
-        print(f"[DEBUG] size: {os.path.getsize(IG_COOKIES_PATH) if os.path.exists(IG_COOKIES_PATH) else 'N/A'}")
-        print(f"[DEBUG] cwd: {os.getcwd()}")
-        print(f"[IG COOKIES] Expected path: {IG_COOKIES_PATH}")
+        logger.info(f"[IG COOKIES] Upload request received")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[DEBUG] Expected cookies path: {IG_COOKIES_PATH}")
+            existing_size = _file_size(IG_COOKIES_PATH)
+            logger.debug(f"[DEBUG] exists: {existing_size is not None}")
+            logger.debug(f"[DEBUG] size: {existing_size if existing_size is not None else 'N/A'}")
+            logger.debug(f"[DEBUG] cwd: {os.getcwd()}")
+        logger.info(f"[IG COOKIES] Expected path: {IG_COOKIES_PATH}")
         
         if 'cookies' not in request.files:
-            print(f"[IG COOKIES] No cookies file in request")
+            logger.info(f"[IG COOKIES] No cookies file in request")
             return jsonify({'success': False, 'error': 'No cookies file provided'}), 400
         
         file = request.files['cookies']
-        print(f"[IG COOKIES] File received: {file.filename}")
+        logger.info(f"[IG COOKIES] File received: {file.filename}")
         
         if file.filename == '':
-            print(f"[IG COOKIES] Empty filename")
+            logger.info(f"[IG COOKIES] Empty filename")
             return jsonify({'success': False, 'error': 'Empty filename'}), 400
         
-        # Ensure app directory exists
-        app_dir = os.path.dirname(IG_COOKIES_PATH)
-        print(f"[IG COOKIES] Ensuring directory exists: {app_dir}")
-        os.makedirs(app_dir, exist_ok=True)
-        
         # Read and validate cookies content
-        print(f"[IG COOKIES] Reading file content")
+        logger.info(f"[IG COOKIES] Reading file content")
         cookies_content = file.read()
-        print(f"[IG COOKIES] File size: {len(cookies_content)} bytes")
+        logger.info(f"[IG COOKIES] File size: {len(cookies_content)} bytes")
         
         # Save cookies file exactly as-is (binary write to preserve exact format)
-        print(f"[IG COOKIES] Saving to: {IG_COOKIES_PATH}")
+        logger.info(f"[IG COOKIES] Saving to: {IG_COOKIES_PATH}")
         with open(IG_COOKIES_PATH, 'wb') as f:
             f.write(cookies_content)
         
@@ -109,20 +241,20 @@ def upload_instagram_cookies():
         with open(IG_COOKIES_PATH, 'r', encoding='utf-8') as f:
             content = f.read()
         if not content.startswith('# Netscape HTTP Cookie File'):
-            print(f"[IG COOKIES] Adding Netscape header for compatibility")
+            logger.info(f"[IG COOKIES] Adding Netscape header for compatibility")
             with open(IG_COOKIES_PATH, 'w', encoding='utf-8') as f:
                 f.write('# Netscape HTTP Cookie File\n# This file is generated by WatchTheFall Portal\n\n' + content)
         
         # Verify file was saved
-        if os.path.exists(IG_COOKIES_PATH):
-            file_size = os.path.getsize(IG_COOKIES_PATH)
-            print(f"[IG COOKIES] File saved successfully: {file_size} bytes")
+        file_size = _file_size(IG_COOKIES_PATH)
+        if file_size is not None:
+            logger.info(f"[IG COOKIES] File saved successfully: {file_size} bytes")
         else:
-            print(f"[IG COOKIES] ERROR: File not found after save!")
+            logger.error(f"[IG COOKIES] ERROR: File not found after save!")
         
-        print(f"[IG COOKIES] Saved Instagram cookies to {IG_COOKIES_PATH}")
-        print(f"[IG-COOKIES] Using cookies: TRUE")
-        print(f"[IG-COOKIES] Cookies file path: {IG_COOKIES_PATH}")
+        logger.info(f"[IG COOKIES] Saved Instagram cookies to {IG_COOKIES_PATH}")
+        logger.info(f"[IG-COOKIES] Using cookies: TRUE")
+        logger.info(f"[IG-COOKIES] Cookies file path: {IG_COOKIES_PATH}")
         log_event('info', None, 'Instagram cookies uploaded')
         
         return jsonify({
@@ -131,9 +263,8 @@ def upload_instagram_cookies():
         })
         
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
-        print(f"[IG COOKIES ERROR]: {error_trace}")
+        logger.error(f"[IG COOKIES ERROR]: {error_trace}")
         log_event('error', None, f'Instagram cookies upload failed: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -143,7 +274,7 @@ def delete_instagram_cookies():
     try:
         if os.path.exists(IG_COOKIES_PATH):
             os.remove(IG_COOKIES_PATH)
-            print(f"[IG COOKIES] Deleted Instagram cookies from {IG_COOKIES_PATH}")
+            logger.info(f"[IG COOKIES] Deleted Instagram cookies from {IG_COOKIES_PATH}")
             log_event('info', None, 'Instagram cookies deleted')
             
             return jsonify({
@@ -157,9 +288,8 @@ def delete_instagram_cookies():
             })
             
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
-        print(f"[IG COOKIES ERROR]: {error_trace}")
+        logger.error(f"[IG COOKIES ERROR]: {error_trace}")
         log_event('error', None, f'Instagram cookies delete failed: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -167,21 +297,22 @@ def delete_instagram_cookies():
 def get_instagram_cookies_status():
     """Check if Instagram cookies file exists"""
     try:
-        print(f"[IG COOKIES STATUS] Checking path: {IG_COOKIES_PATH}")
-        exists = os.path.exists(IG_COOKIES_PATH)
-        print(f"[IG COOKIES STATUS] File exists: {exists}")
-        file_size = os.path.getsize(IG_COOKIES_PATH) if exists else 0
+        logger.info(f"[IG COOKIES STATUS] Checking path: {IG_COOKIES_PATH}")
+        file_size = _file_size(IG_COOKIES_PATH)
+        exists = file_size is not None
+        logger.info(f"[IG COOKIES STATUS] File exists: {exists}")
+        file_size = file_size or 0
         readable = False
         if exists:
             try:
                 with open(IG_COOKIES_PATH, 'r') as f:
                     f.read(100)  # Try to read first 100 chars
                 readable = True
-                print(f"[IG COOKIES STATUS] File size: {file_size} bytes")
+                logger.info(f"[IG COOKIES STATUS] File size: {file_size} bytes")
             except:
                 readable = False
-                print(f"[IG COOKIES STATUS] File not readable")
-        return jsonify({
+                logger.warning(f"[IG COOKIES STATUS] File not readable")
+        return ojsonify({
             'success': True,
             'exists': exists,
             'size': file_size,
@@ -189,7 +320,7 @@ def get_instagram_cookies_status():
             'readable': readable
         })
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
 
 # ============================================================================
 # API: VIDEO PROCESSING
@@ -201,11 +332,11 @@ def get_instagram_cookies_status():
 def fetch_videos_from_urls():
     """Download videos from URLs (TikTok, Instagram, X) - up to 5 at a time"""
     try:
-        if not YoutubeDL:
+        if not _load_youtube_dl():
             return jsonify({'success': False, 'error': 'yt-dlp not installed'}), 500
         
-        data = request.get_json(force=True) or {}
-        urls = data.get('urls') or []
+        data = _request_json()
+        urls = (data.get('urls') if isinstance(data, dict) else None) or []
         
         if not isinstance(urls, list) or len(urls) == 0:
             return jsonify({'success': False, 'error': 'Provide JSON: {"urls": ["url1", "url2", ...]}'}), 400
@@ -213,88 +344,107 @@ def fetch_videos_from_urls():
         if len(urls) > 5:
             return jsonify({'success': False, 'error': 'Maximum 5 URLs at a time (Render free tier limit)'}), 400
         
-        print(f"[FETCH] Downloading {len(urls)} videos from URLs")
+        logger.info(f"[FETCH] Downloading {len(urls)} videos from URLs")
         log_event('info', None, f'Fetching {len(urls)} URLs')
         
+        # Options and the cookie check are the same for every URL in the batch
+        ydl_opts = {
+            'outtmpl': os.path.join(OUTPUT_DIR, '%(id)s.%(ext)s'),
+            'merge_output_format': 'mp4',
+            'format': 'mp4/best',
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'geo_bypass': True,
+            'force_ipv4': True,
+            # HLS/DASH (TikTok, Instagram) fragments fetched in parallel; the native
+            # downloader requests plain HTTP in 10MB ranges to dodge per-connection
+            # throttling; transient network errors are retried
+            'concurrent_fragment_downloads': 4,
+            'http_chunk_size': 10 * 1024 * 1024,
+            'retries': 3,
+            'fragment_retries': 3,
+            'extractor_retries': 2,
+        }
+        
+        # Segmented multi-connection downloads when aria2c is installed
+        if ARIA2C_AVAILABLE:
+            ydl_opts['external_downloader'] = {'default': 'aria2c'}
+            ydl_opts['external_downloader_args'] = {'aria2c': ARIA2C_ARGS}
+        
+        # Add Instagram cookies if available
+        logger.info(f"[FETCH] Checking for cookies at: {IG_COOKIES_PATH}")
+        try:
+            cookies_stat = os.stat(IG_COOKIES_PATH)
+        except FileNotFoundError:
+            cookies_stat = None
+        has_cookies = cookies_stat is not None
+        if has_cookies:
+            logger.info(f"[FETCH] Cookies file found: {cookies_stat.st_size} bytes")
+            ydl_opts['cookiefile'] = IG_COOKIES_PATH
+            logger.info("[IG-COOKIES] Authenticated mode enabled")
+            logger.info(f"[FETCH] Using Instagram cookies from {IG_COOKIES_PATH}")
+        else:
+            logger.info("[IG-COOKIES] Fallback to public mode")
+            logger.info("[FETCH] No Instagram cookies found, using normal mode")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[FETCH] Current working directory: {os.getcwd()}")
+                logger.debug(f"[FETCH] Directory contents: {os.listdir(os.path.dirname(IG_COOKIES_PATH)) if os.path.exists(os.path.dirname(IG_COOKIES_PATH)) else 'DIR NOT FOUND'}")
+        
+        # Each pool thread keeps its YoutubeDL while this key is unchanged; a
+        # cookie upload or delete changes the mtime / cookiefile option
+        ydl_key = _youtube_dl_key(ydl_opts, cookies_stat.st_mtime_ns if has_cookies else None)
+        
         def download_one(url_input):
             try:
-                # Base yt-dlp options
-                ydl_opts = {
-                    'outtmpl': os.path.join(OUTPUT_DIR, '%(id)s.%(ext)s'),
-                    'merge_output_format': 'mp4',
-                    'format': 'mp4/best',
-                    'noplaylist': True,
-                    'quiet': True,
-                    'no_warnings': True,
-                    'geo_bypass': True,
-                    'force_ipv4': True,
-                }
+                # Check if this is an Instagram URL and cookies are required
+                if not has_cookies and 'instagram.com' in url_input.lower():
+                    logger.error("[FETCH ERROR] Instagram requires login. Cookies missing or unreadable.")
+                    return {
+                        'url': url_input,
+                        'error': 'Instagram requires login. Cookies missing or unreadable.',
+                        'success': False
+                    }
                 
-                # Add Instagram cookies if available
-                print(f"[FETCH] Checking for cookies at: {IG_COOKIES_PATH}")
-                if os.path.exists(IG_COOKIES_PATH):
-                    file_size = os.path.getsize(IG_COOKIES_PATH)
-                    print(f"[FETCH] Cookies file found: {file_size} bytes")
-                    ydl_opts['cookiefile'] = IG_COOKIES_PATH
-                    print("[IG-COOKIES] Authenticated mode enabled")
-                    print(f"[FETCH] Using Instagram cookies from {IG_COOKIES_PATH}")
-                else:
-                    print("[IG-COOKIES] Fallback to public mode")
-                    print("[FETCH] No Instagram cookies found, using normal mode")
-                    print(f"[FETCH] Current working directory: {os.getcwd()}")
-                    print(f"[FETCH] Directory contents: {os.listdir(os.path.dirname(IG_COOKIES_PATH)) if os.path.exists(os.path.dirname(IG_COOKIES_PATH)) else 'DIR NOT FOUND'}")
+                ydl = _get_youtube_dl(dict(ydl_opts), ydl_key)
+                logger.info(f"[FETCH] Downloading: {url_input[:50]}...")
+                try:
+                    info = ydl.extract_info(url_input, download=True)
+                    filename = ydl.prepare_filename(info)
                     
-                    # Check if this is an Instagram URL and cookies are required
-                    if 'instagram.com' in url_input.lower():
-                        print("[FETCH ERROR] Instagram requires login. Cookies missing or unreadable.")
-                        return {
-                            'url': url_input,
-                            'error': 'Instagram requires login. Cookies missing or unreadable.',
-                            'success': False
-                        }
-                
-                with YoutubeDL(ydl_opts) as ydl:
-                    print(f"[FETCH] Downloading: {url_input[:50]}...")
-                    try:
-                        info = ydl.extract_info(url_input, download=True)
-                        filename = ydl.prepare_filename(info)
-                        
-                        # Ensure .mp4 extension
-                        if not filename.endswith('.mp4'):
-                            base, _ = os.path.splitext(filename)
-                            filename = base + '.mp4'
-                        
-                        name = os.path.basename(filename)
-                        file_exists = os.path.exists(filename)
-                        file_size_mb = os.path.getsize(filename) / (1024 * 1024) if file_exists else 0
-                        
-                        if not file_exists or file_size_mb == 0:
-                            print(f"[FETCH WARNING] File may not have downloaded properly: {filename} (exists: {file_exists}, size: {file_size_mb:.2f}MB)")
-                            # Check if we have error information in the info dict
-                            if info and 'error' in info:
-                                print(f"[FETCH ERROR DETAIL] yt-dlp error: {info['error']}")
-                        
-                        print(f"[FETCH] Success: {name} ({file_size_mb:.2f}MB)")
-                        return {
-                            'url': url_input,
-                            'filename': name,
-                            'download_url': f'/api/videos/download/{name}',
-                            'size_mb': round(file_size_mb, 2),
-                            'success': file_exists and file_size_mb > 0
-                        }
-                    except Exception as download_error:
-                        print(f"[FETCH ERROR] Download failed for {url_input}: {str(download_error)}")
-                        import traceback
-                        traceback.print_exc()
-                        return {
-                            'url': url_input,
-                            'error': str(download_error),
-                            'success': False
-                        }
+                    # Ensure .mp4 extension
+                    if not filename.endswith('.mp4'):
+                        base, _ = os.path.splitext(filename)
+                        filename = base + '.mp4'
+                    
+                    name = os.path.basename(filename)
+                    file_size = _file_size(filename)
+                    file_exists = file_size is not None
+                    file_size_mb = file_size / (1024 * 1024) if file_exists else 0
+                    
+                    if not file_exists or file_size_mb == 0:
+                        logger.warning(f"[FETCH WARNING] File may not have downloaded properly: {filename} (exists: {file_exists}, size: {file_size_mb:.2f}MB)")
+                        # Check if we have error information in the info dict
+                        if info and 'error' in info:
+                            logger.error(f"[FETCH ERROR DETAIL] yt-dlp error: {info['error']}")
+                    
+                    logger.info(f"[FETCH] Success: {name} ({file_size_mb:.2f}MB)")
+                    return {
+                        'url': url_input,
+                        'filename': name,
+                        'download_url': f'/api/videos/download/{name}',
+                        'size_mb': round(file_size_mb, 2),
+                        'success': file_exists and file_size_mb > 0
+                    }
+                except Exception as download_error:
+                    logger.exception(f"[FETCH ERROR] Download failed for {url_input}: {str(download_error)}")
+                    return {
+                        'url': url_input,
+                        'error': str(download_error),
+                        'success': False
+                    }
             except Exception as e:
-                print(f"[FETCH ERROR] {url_input}: {str(e)}")
-                import traceback
-                traceback.print_exc()
+                logger.exception(f"[FETCH ERROR] {url_input}: {str(e)}")
                 return {
                     'url': url_input,
                     'error': str(e),
@@ -302,63 +452,148 @@ def fetch_videos_from_urls():
                     'details': traceback.format_exc()
                 }
         
-        # Download sequentially to keep memory low
-        results = []
-        for url in urls:
-            results.append(download_one(url))
+        # Async: hand the batch to the pool and return a job to poll, so this
+        # worker isn't held for the whole download
+        if data.get('async'):
+            _evict_fetch_jobs()
+            job_id = secrets.token_hex(16)
+            fetch_jobs[job_id] = {'status': 'processing', 'total': len(urls)}
+            _track_fetch_job(job_id, [fetch_executor.submit(download_one, url) for url in urls])
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'processing',
+                'status_url': url_for('get_fetch_status', job_id=job_id),
+                'total': len(urls)
+            }), 202
         
-        success_count = sum(1 for r in results if r.get('success'))
-        log_event('info', None, f'Fetch complete: {success_count}/{len(urls)} successful')
+        # Download concurrently - yt-dlp is network-bound, so pool threads
+        # overlap the waits; each thread uses its own YoutubeDL instance
+        results = list(fetch_executor.map(download_one, urls))
         
-        return jsonify({
-            'success': True,
-            'total': len(urls),
-            'successful': success_count,
-            'results': results
-        })
+        return jsonify({'success': True, **_fetch_summary(results)})
         
     except Exception as e:
-        import traceback
-        print(f"[FETCH EXCEPTION]:")
-        traceback.print_exc()
+        logger.exception(f"[FETCH EXCEPTION] {str(e)}")
         log_event('error', None, f'Fetch failed: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _fetch_summary(results):
+    """Response fields for a finished fetch batch"""
+    success_count = sum(1 for r in results if r.get('success'))
+    log_event('info', None, f'Fetch complete: {success_count}/{len(results)} successful')
+    if success_count:
+        sweep_outputs()
+    return {
+        'total': len(results),
+        'successful': success_count,
+        'results': results
+    }
+
+def _evict_fetch_jobs():
+    """Forget async fetch jobs that finished more than FETCH_JOB_TTL ago"""
+    cutoff = time.time() - FETCH_JOB_TTL
+    for job_id, job in list(fetch_jobs.items()):
+        finished_at = job.get('finished_at')
+        if finished_at and finished_at < cutoff:
+            fetch_jobs.pop(job_id, None)
+
+def _track_fetch_job(job_id, futures):
+    """Mark an async fetch job completed (or failed) once all of its downloads finish"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def on_done(_future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        # download_one returns an error dict rather than raising, but an error
+        # here would be swallowed by the future and leave the job 'processing'
+        try:
+            fetch_jobs[job_id].update(status='completed', finished_at=time.time(),
+                                      **_fetch_summary([f.result() for f in futures]))
+        except Exception as e:
+            logger.exception(f"[FETCH EXCEPTION] Job {job_id[:8]}: {str(e)}")
+            fetch_jobs[job_id].update(status='failed', finished_at=time.time(), error=str(e))
+    
+    for future in futures:
+        future.add_done_callback(on_done)
+
+@app.route('/api/videos/fetch-status/<job_id>', methods=['GET'])
+def get_fetch_status(job_id):
+    """Poll async fetch job status (non-blocking)"""
+    job = fetch_jobs.get(job_id)
+    if job is None:
+        return ojsonify({
+            'error': 'Job not found',
+            'job_id': job_id,
+            'message': 'Invalid job ID or job expired.'
+        }, 404)
+    return ojsonify({'job_id': job_id, **job})
+
 # Process endpoint removed - using client-side Canvas watermarking only
 
 # Status endpoint removed - no server-side job queue
 
+def _download_name_params(filename):
+    """Content-Disposition filename params, built the way send_from_directory builds them
+
+    Non-ASCII names get an ASCII fallback plus an RFC 5987 filename* param.
+    """
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"}
+    return {'filename': filename}
+
 @app.route('/api/videos/download/<filename>', methods=['GET'])
 def download_video(filename):
-    """Download processed video"""
+    """Download processed video (?inline=1 serves it for in-browser playback)"""
     try:
-        filepath = os.path.join(OUTPUT_DIR, filename)
+        filepath = safe_join(OUTPUT_DIR, filename)
+        inline = request.args.get('inline') == '1'
+        disposition = 'inline' if inline else 'attachment'
         
         # Check if file exists
-        if not os.path.exists(filepath):
-            print(f"[DOWNLOAD ERROR] File not found: {filepath}")
+        file_size = _file_size(filepath) if filepath else None
+        if file_size is None:
+            logger.error(f"[DOWNLOAD ERROR] File not found: {filepath}")
             return jsonify({'error': 'File not found', 'path': filepath}), 404
         
-        file_size = os.path.getsize(filepath)
-        print(f"[DOWNLOAD] Serving file: {filename} ({file_size} bytes)")
-        
-        # Send file with proper headers for downloads folder
-        response = send_from_directory(OUTPUT_DIR, filename, as_attachment=True)
+        logger.info(f"[DOWNLOAD] Serving file: {filename} ({file_size} bytes)")
         
-        # Add Content-Disposition header to suggest Downloads folder
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if X_ACCEL_REDIRECT_PREFIX:
+            # Hand the transfer to nginx, which sendfile()s it straight from disk
+            # (nginx handles Range/conditional requests itself)
+            response = app.response_class(mimetype='video/mp4')
+            response.headers['X-Accel-Redirect'] = f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(filename)}"
+            response.headers.set('Content-Disposition', disposition, **_download_name_params(filename))
+            response.cache_control.max_age = DOWNLOAD_MAX_AGE
+        else:
+            # Send file with proper headers for downloads folder. conditional=True
+            # honours Range (resumed/partial downloads, and seeking when played
+            # inline) and If-None-Match / If-Modified-Since against the file's
+            # ETag and mtime.
+            # (sent as an X-Sendfile header instead when USE_X_SENDFILE is on)
+            response = send_from_directory(
+                OUTPUT_DIR, filename,
+                mimetype='video/mp4',
+                as_attachment=not inline,
+                download_name=filename,
+                conditional=True,
+                etag=True,
+                max_age=DOWNLOAD_MAX_AGE
+            )
         
         # Mobile-friendly headers
-        response.headers['Content-Type'] = 'video/mp4'
-        response.headers['Cache-Control'] = 'no-cache'
         response.headers['X-Content-Type-Options'] = 'nosniff'
         
-        print(f"[DOWNLOAD] Headers set for {filename}")
+        logger.info(f"[DOWNLOAD] Headers set for {filename}")
         return response
     except Exception as e:
-        print(f"[DOWNLOAD EXCEPTION] {filename}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[DOWNLOAD EXCEPTION] {filename}: {str(e)}")
         return jsonify({'error': 'File not found', 'details': str(e), 'filename': filename, 'filepath': filepath}), 404
 
 # Recent videos endpoint removed - using localStorage history only
@@ -372,67 +607,122 @@ def download_video(filename):
 # API: WATERMARK CONVERSION (WebM to MP4)
 # ============================================================================
 
+@app.before_request
+def start_janitor():
+    """Keep OUTPUT_DIR bounded - sweep thread is started per process on first request"""
+    ensure_janitor()
+
+@app.before_request
+def reject_disallowed_uploads():
+    """Refuse a conversion upload from its headers, before any of the body is read
+
+    Multipart clients can declare the file in X-Upload-Filename; raw uploads
+    always carry it in X-Filename.
+    """
+    if request.endpoint != 'convert_watermark':
+        return None
+    
+    declared = request.headers.get('X-Upload-Filename') or request.headers.get('X-Filename')
+    if declared and not allowed_file(declared, _WATERMARK_SUFFIXES):
+        return jsonify({'error': 'File type not allowed', 'reason': 'bad_extension'}), 400
+    
+    if request.content_length and request.content_length > MAX_UPLOAD_SIZE:
+        return jsonify({'error': 'File too large', 'reason': 'too_large'}), 413
+    
+    return None
+
 @app.route('/api/videos/convert-watermark', methods=['POST'])
 def convert_watermark():
-    """Queue a watermark conversion job (async, non-blocking)"""
+    """Queue a watermark conversion job (async, non-blocking)
+
+    Accepts either a multipart form with a 'video' file, or the raw video as the
+    request body with its filename in the X-Filename header. The raw form is
+    streamed straight to disk without multipart parsing. Declared filenames are
+    checked by reject_disallowed_uploads() before the body is read.
+    """
     try:
-        if 'video' not in request.files:
-            return jsonify({'error': 'No video file provided', 'reason': 'no_file'}), 400
-        
-        file = request.files['video']
+        file = None
+        if request.mimetype == 'multipart/form-data':
+            if 'video' not in request.files:
+                return jsonify({'error': 'No video file provided', 'reason': 'no_file'}), 400
+            
+            file = request.files['video']
+            upload_name = file.filename
+        else:
+            upload_name = request.headers.get('X-Filename', '')
+            if not request.content_length:
+                return jsonify({'error': 'No video file provided', 'reason': 'no_file'}), 400
         
-        if file.filename == '':
+        if upload_name == '':
             return jsonify({'error': 'Empty filename', 'reason': 'empty_filename'}), 400
         
-        # Generate job ID
-        job_id = uuid.uuid4().hex
+        # Backpressure: don't accept more work than the worker can drain
+        if conversion_queue.full():
+            return _conversion_queue_full_response()
         
-        # Save WebM file temporarily
-        webm_filename = secure_filename(file.filename)
-        temp_webm = os.path.join(tempfile.gettempdir(), f"{job_id}_{webm_filename}")
-        file.save(temp_webm)
+        # Generate job ID
+        job_id = secrets.token_hex(16)
         
-        # Generate output MP4 filename
-        mp4_filename = webm_filename.replace('.webm', '.mp4')
-        if not mp4_filename.endswith('.mp4'):
-            mp4_filename = os.path.splitext(mp4_filename)[0] + '.mp4'
+        # Stage the upload in the portal's temp dir (on the same disk as the
+        # outputs) rather than the system temp dir, which may be RAM-backed tmpfs
+        webm_filename = secure_filename(upload_name)
+        temp_webm = os.path.join(TEMP_DIR, f"{job_id}_{webm_filename}")
+        if file is not None:
+            digest = _save_file_storage(file, temp_webm)
+        else:
+            digest = _save_request_stream(request.stream, temp_webm)
         
+        # Output name carries the upload's content hash, so a re-upload of the
+        # same clip maps to the same MP4 and needn't be converted again
+        mp4_filename = f"{os.path.splitext(webm_filename)[0]}_{digest[:16]}.mp4"
         output_path = os.path.join(OUTPUT_DIR, mp4_filename)
         
-        # Initialize job status
-        watermark_jobs[job_id] = {
-            'status': 'queued',
-            'filename': mp4_filename,
-            'webm_path': temp_webm,
-            'output_path': output_path,
-            'created_at': time.time(),
-            'message': 'Waiting for conversion worker...'
-        }
+        # Checking for a duplicate and registering this job is one step, so two
+        # identical uploads finishing together can't both be queued
+        with _conversion_submit_lock:
+            duplicate = _existing_conversion(job_id, output_path, mp4_filename)
+            if duplicate is None:
+                # Initialize job status
+                watermark_jobs[job_id] = {
+                    'status': 'queued',
+                    'filename': mp4_filename,
+                    'webm_path': temp_webm,
+                    'output_path': output_path,
+                    'created_at': time.time(),
+                    'message': 'Waiting for conversion worker...'
+                }
+                
+                # Hand off to the conversion worker
+                try:
+                    conversion_queue.put_nowait((job_id, temp_webm, output_path, mp4_filename))
+                except queue.Full:
+                    del watermark_jobs[job_id]
+                    duplicate = _conversion_queue_full_response()
         
-        print(f"[CONVERT] Job {job_id[:8]} queued: {webm_filename} → {mp4_filename}")
-        log_event('info', None, f'Watermark conversion queued: {job_id[:8]} - {webm_filename}')
+        if duplicate is not None:
+            try:
+                os.remove(temp_webm)
+            except:
+                pass
+            return duplicate
+        _ensure_conversion_worker()
         
-        # Start background conversion thread
-        thread = threading.Thread(
-            target=_watermark_conversion_worker,
-            args=(job_id, temp_webm, output_path, mp4_filename),
-            daemon=True
-        )
-        thread.start()
+        logger.info(f"[CONVERT] Job {job_id[:8]} queued: {webm_filename} → {mp4_filename}")
+        log_event('info', None, f'Watermark conversion queued: {job_id[:8]} - {webm_filename}')
         
-        # Return immediately with job ID
+        # Return immediately with job ID (202: accepted, not yet done)
         return jsonify({
             'success': True,
             'job_id': job_id,
             'status': 'queued',
+            'status_url': url_for('get_conversion_status', job_id=job_id),
             'filename': mp4_filename,
-            'message': 'Conversion job queued. Poll /api/videos/convert-status/<job_id> for progress.'
-        })
+            'message': 'Conversion job queued. Poll status_url for progress.'
+        }), 202
         
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
-        print(f"[CONVERT QUEUE EXCEPTION]: {error_trace}")
+        logger.error(f"[CONVERT QUEUE EXCEPTION]: {error_trace}")
         log_event('error', None, f'Conversion queue error: {str(e)}')
         return jsonify({
             'error': str(e),
@@ -441,51 +731,287 @@ def convert_watermark():
         }), 500
 
 
+def allowed_file(filename, suffixes=None):
+    """Check if file extension is allowed (suffixes: a tuple like _ALLOWED_SUFFIXES)"""
+    return filename.lower().endswith(suffixes or _ALLOWED_SUFFIXES)
+
+
+def _open_upload_file(path):
+    """Create a staged upload file (owner-only) for unbuffered writes"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return os.fdopen(fd, 'wb', buffering=0)
+
+
+def _save_request_stream(stream, path):
+    """Copy a raw request body to disk in UPLOAD_CHUNK_SIZE chunks; returns its SHA-256 hex digest"""
+    digest = hashlib.sha256()
+    # Chunks are already large, so write them straight through rather than
+    # copying each into a BufferedWriter first
+    with _open_upload_file(path) as out:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def _file_sha256(path):
+    """SHA-256 hex digest of a file on disk"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_file_storage(file, path):
+    """Save a multipart upload, using an in-kernel copy when Werkzeug spooled it to disk
+
+    Returns the upload's SHA-256 hex digest.
+    """
+    stream = file.stream
+    # Werkzeug spools uploads in a SpooledTemporaryFile, whose fileno() first
+    # rolls an in-memory upload over to disk - small uploads are just written out
+    if not hasattr(os, 'sendfile') or getattr(stream, '_rolled', True) is False:
+        return _save_request_stream(stream, path)
+    try:
+        src_fd = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return _save_request_stream(stream, path)
+    
+    stream.flush()
+    start = offset = stream.tell()
+    try:
+        with _open_upload_file(path) as out:
+            while True:
+                sent = os.sendfile(out.fileno(), src_fd, offset, UPLOAD_CHUNK_SIZE * 4)
+                if sent == 0:
+                    break
+                offset += sent
+    except OSError:
+        # Some platforms (e.g. macOS) only sendfile to sockets
+        stream.seek(start)
+        return _save_request_stream(stream, path)
+    # Hashed from the staged copy, which is still in the page cache
+    return _file_sha256(path)
+
+
+def _existing_conversion(job_id, output_path, mp4_filename):
+    """Response for an upload whose MP4 already exists or is being converted, else None"""
+    for other_id, job in list(watermark_jobs.items()):
+        if job.get('output_path') == output_path and job['status'] in ('queued', 'processing'):
+            logger.info(f"[CONVERT] Duplicate upload, joining job {other_id[:8]}")
+            return jsonify({
+                'success': True,
+                'job_id': other_id,
+                'status': job['status'],
+                'status_url': url_for('get_conversion_status', job_id=other_id),
+                'filename': mp4_filename,
+                'message': 'Identical video is already being converted. Poll status_url for progress.'
+            }), 202
+    
+    size = _file_size(output_path)
+    if not size:
+        return None
+    
+    # Already converted - mark it recently used so the janitor keeps it. The
+    # janitor may have deleted it since the size check; then convert again
+    try:
+        os.utime(output_path)
+    except FileNotFoundError:
+        return None
+    watermark_jobs[job_id] = {
+        'status': 'completed',
+        'filename': mp4_filename,
+        'output_path': output_path,
+        'created_at': time.time(),
+        'completed_at': time.time(),
+        'download_url': f'/api/videos/download/{mp4_filename}',
+        'size_mb': round(size / (1024 * 1024), 2),
+        'conversion_time': 0.0,
+        'message': 'Video converted to MP4 successfully'
+    }
+    logger.info(f"[CONVERT] Job {job_id[:8]} served from existing {mp4_filename}")
+    log_event('info', None, f'Conversion {job_id[:8]} reused {mp4_filename}')
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'completed',
+        'status_url': url_for('get_conversion_status', job_id=job_id),
+        'filename': mp4_filename,
+        'download_url': watermark_jobs[job_id]['download_url'],
+        'cached': True,
+        'message': 'Identical video was already converted.'
+    })
+
+
+def _conversion_queue_full_response():
+    """503 response when the conversion queue is at capacity"""
+    response = jsonify({
+        'error': 'Conversion queue is full',
+        'reason': 'queue_full',
+        'message': 'Server is busy converting other videos. Try again shortly.'
+    })
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+
+def _ensure_conversion_worker():
+    """Start conversion worker threads up to CONVERSION_WORKERS in this process"""
+    with _conversion_worker_lock:
+        _conversion_workers[:] = [t for t in _conversion_workers if t.is_alive()]
+        while len(_conversion_workers) < CONVERSION_WORKERS:
+            worker = threading.Thread(
+                target=_conversion_worker_loop,
+                name=f'watermark-conversion-{len(_conversion_workers)}',
+                daemon=True
+            )
+            worker.start()
+            _conversion_workers.append(worker)
+
+
+def _conversion_worker_loop():
+    """Drain the conversion queue one job at a time"""
+    while True:
+        job_id, temp_webm, output_path, mp4_filename = conversion_queue.get()
+        try:
+            _watermark_conversion_worker(job_id, temp_webm, output_path, mp4_filename)
+        finally:
+            conversion_queue.task_done()
+
+
+@lru_cache(maxsize=1)
+def _video_encoder_args():
+    """Return FFmpeg video encoder args, preferring a working hardware H.264 encoder (detected once per process)"""
+    args = pick_encoder_args(FFMPEG_BIN, HARDWARE_ENCODERS, SOFTWARE_ENCODER_ARGS)
+    logger.info(f"[CONVERT] Video encoder: {args[1]}")
+    return args
+
+
+def _hwaccel_args():
+    """-hwaccel auto when a hardware encoder was found, so decoding moves off the CPU too
+
+    FFmpeg falls back to software decoding if the codec has no hardware path.
+    """
+    return [] if _video_encoder_args() is SOFTWARE_ENCODER_ARGS else ['-hwaccel', 'auto']
+
+
+def _probe_stream_codecs(path):
+    """Return (video_codec, audio_codec, pix_fmt) for a media file, None when absent"""
+    try:
+        result = subprocess.run(
+            [FFPROBE_BIN, '-v', 'quiet', '-print_format', 'json', '-show_streams', path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=30
+        )
+        streams = json.loads(result.stdout or b'{}').get('streams', [])
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None, None, None
+    
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio_codec = next((s.get('codec_name') for s in streams if s.get('codec_type') == 'audio'), None)
+    return video.get('codec_name'), audio_codec, video.get('pix_fmt')
+
+
+def _cap_ffmpeg_memory(process):
+    """Cap a just-spawned FFmpeg's address space at FFMPEG_MAX_MEMORY_MB
+
+    Set on the child after spawn (preexec_fn isn't safe with threads); past the
+    cap FFmpeg's allocations fail and it exits instead of the whole instance
+    being OOM-killed.
+    """
+    limit = FFMPEG_MAX_MEMORY_MB * 1024 * 1024
+    try:
+        resource.prlimit(process.pid, resource.RLIMIT_AS, (limit, limit))
+    except OSError as e:
+        logger.warning(f"[CONVERT] Could not cap FFmpeg memory: {e}")
+
+
+def _run_conversion_ffmpeg(cmd):
+    """Run a conversion FFmpeg command; returns (returncode, stderr tail lines, timed_out)"""
+    # Run FFmpeg conversion (worker thread won't block Gunicorn worker)
+    on_spawn = _cap_ffmpeg_memory if FFMPEG_MAX_MEMORY_MB and hasattr(resource, 'prlimit') else None
+    return run_ffmpeg(cmd, CONVERSION_TIMEOUT, STDERR_TAIL_LINES, on_spawn=on_spawn)
+
+
 def _watermark_conversion_worker(job_id, temp_webm, output_path, mp4_filename):
-    """Background worker for FFmpeg watermark conversion (runs in separate thread)"""
+    """FFmpeg watermark conversion for a single job (runs on the conversion worker thread)"""
+    # FFmpeg writes beside the output and it is renamed into place on success:
+    # a file at output_path is served as a finished (cached) conversion, so a
+    # half-written or failed encode must never appear there. The job id keeps
+    # two jobs for the same clip from writing into one partial file
+    part_path = f"{output_path}.{job_id}.part"
     try:
         # Update status to processing
         watermark_jobs[job_id]['status'] = 'processing'
         watermark_jobs[job_id]['message'] = 'Converting WebM to MP4...'
         watermark_jobs[job_id]['started_at'] = time.time()
         
-        print(f"[CONVERT] Job {job_id[:8]} started: {mp4_filename}")
-        
-        # FFmpeg command: MAXIMUM SPEED for Render free tier
-        # Sacrificing quality for speed to avoid timeouts
-        cmd = [
-            'ffmpeg',
-            '-analyzeduration', '500000',    # Reduced analysis time
-            '-probesize', '500000',          # Reduced probe size
-            '-i', temp_webm,
-            '-map', '0:v:0',
-            '-map', '0:a?',
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',          # FASTEST preset (was veryfast)
-            '-tune', 'fastdecode',           # Optimize for fast decode
-            '-threads', '0',                 # Use all available threads (was 1)
-            '-crf', '28',                    # Higher = lower quality but MUCH faster (was 23)
-            '-profile:v', 'baseline',
-            '-level', '3.0',
-            '-pix_fmt', 'yuv420p',
-            '-c:a', 'aac',
-            '-b:a', '96k',                   # Lower audio bitrate (was 128k)
-            '-ar', '44100',
-            '-shortest',
-            '-fflags', '+genpts',
-            '-movflags', '+faststart',
-            '-max_muxing_queue_size', '512', # Reduced queue (was 1024)
-            '-y',
-            output_path
-        ]
+        logger.info(f"[CONVERT] Job {job_id[:8]} started: {mp4_filename}")
         
-        # Run FFmpeg conversion (background thread won't block Gunicorn worker)
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=300  # 5 minute timeout
-        )
+        video_codec, audio_codec, pix_fmt = _probe_stream_codecs(temp_webm)
+        if (video_codec in STREAM_COPY_VIDEO_CODECS and audio_codec in STREAM_COPY_AUDIO_CODECS
+                and pix_fmt in STREAM_COPY_PIX_FMTS):
+            # Already H.264/AAC - remux into MP4 without re-encoding
+            logger.info(f"[CONVERT] Job {job_id[:8]} input is {video_codec}/{audio_codec}, remuxing")
+            reencode = False
+            watermark_jobs[job_id]['message'] = 'Remuxing to MP4...'
+            cmd = [
+                FFMPEG_BIN,
+                '-nostats', '-hide_banner',      # Errors only in stderr, no progress lines
+                '-i', temp_webm,
+                '-map', '0:v:0',
+                '-map', '0:a?',
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                '-f', 'mp4',                     # part_path has no .mp4 extension to infer from
+                '-y',
+                part_path
+            ]
+        else:
+            # FFmpeg command: MAXIMUM SPEED for Render free tier
+            # Sacrificing quality for speed to avoid timeouts
+            reencode = True
+            cmd = [
+                FFMPEG_BIN,
+                '-nostats', '-hide_banner',      # Errors only in stderr, no progress lines
+                '-analyzeduration', '500000',    # Reduced analysis time
+                '-probesize', '500000',          # Reduced probe size
+                *_hwaccel_args(),                # GPU decode alongside a GPU encoder
+                '-i', temp_webm,
+                '-map', '0:v:0',
+                '-map', '0:a?',
+                *_video_encoder_args(),          # Hardware H.264 if present, else libx264 ultrafast
+                '-threads', str(FFMPEG_THREADS), # Default 0 = all visible CPUs (was 1)
+                '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac',
+                '-b:a', '96k',                   # Lower audio bitrate (was 128k)
+                '-ar', '44100',
+                '-shortest',
+                '-fflags', '+genpts',
+                '-movflags', '+faststart',
+                '-max_muxing_queue_size', '512', # Reduced queue (was 1024)
+                '-f', 'mp4',
+                '-y',
+                part_path
+            ]
+        
+        # Re-encodes are the memory hog: at most MAX_CONCURRENT_FFMPEG run at
+        # once whatever the worker count. Remuxes are cheap and skip the gate.
+        if reencode:
+            if not _encode_slots.acquire(blocking=False):
+                watermark_jobs[job_id]['message'] = 'Waiting for a free encoder...'
+                _encode_slots.acquire()
+                watermark_jobs[job_id]['message'] = 'Converting WebM to MP4...'
+            try:
+                returncode, stderr_tail, timed_out = _run_conversion_ffmpeg(cmd)
+            finally:
+                _encode_slots.release()
+        else:
+            returncode, stderr_tail, timed_out = _run_conversion_ffmpeg(cmd)
         
         # Clean up temp WebM
         try:
@@ -493,21 +1019,43 @@ def _watermark_conversion_worker(job_id, temp_webm, output_path, mp4_filename):
         except:
             pass
         
-        if result.returncode != 0:
-            stderr_output = result.stderr.decode('utf-8', errors='ignore')
-            error_preview = stderr_output[:500] if len(stderr_output) > 500 else stderr_output
-            print(f"[CONVERT] Job {job_id[:8]} FAILED (exit {result.returncode}): {error_preview}")
+        if timed_out:
+            raise subprocess.TimeoutExpired(cmd, CONVERSION_TIMEOUT)
+        
+        if returncode != 0:
+            error_preview = b''.join(stderr_tail)[-500:].decode('utf-8', errors='ignore')
+            # SIGKILL that isn't our timeout is the kernel OOM killer; under the
+            # address-space cap a failed allocation instead aborts FFmpeg or
+            # makes it exit with ENOMEM. Say so explicitly either way
+            out_of_memory = (returncode in (-signal.SIGKILL, -signal.SIGABRT)
+                             or any(marker in line for line in stderr_tail for marker in OUT_OF_MEMORY_MARKERS))
+            if out_of_memory:
+                logger.error(f"[CONVERT] Job {job_id[:8]} FAILED (exit {returncode}): FFmpeg ran out of memory")
+            else:
+                logger.error(f"[CONVERT] Job {job_id[:8]} FAILED (exit {returncode}): {error_preview}")
             
             watermark_jobs[job_id]['status'] = 'failed'
-            watermark_jobs[job_id]['error'] = 'FFmpeg conversion failed'
+            watermark_jobs[job_id]['error'] = 'FFmpeg ran out of memory' if out_of_memory else 'FFmpeg conversion failed'
             watermark_jobs[job_id]['stderr_preview'] = error_preview
-            watermark_jobs[job_id]['exit_code'] = result.returncode
+            watermark_jobs[job_id]['exit_code'] = returncode
             watermark_jobs[job_id]['message'] = 'Video conversion failed. Try a shorter video.'
             log_event('error', None, f'Conversion {job_id[:8]} failed: {error_preview[:100]}')
             return
         
+        # One stat both checks FFmpeg actually wrote something and sizes it
+        output_size = _file_size(part_path)
+        if not output_size:
+            logger.error(f"[CONVERT] Job {job_id[:8]} FAILED: exit 0 but no output written")
+            watermark_jobs[job_id]['status'] = 'failed'
+            watermark_jobs[job_id]['error'] = 'FFmpeg produced no output'
+            watermark_jobs[job_id]['message'] = 'Video conversion failed. Try a shorter video.'
+            log_event('error', None, f'Conversion {job_id[:8]} produced no output')
+            return
+        
+        os.replace(part_path, output_path)
+        
         # Success
-        file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+        file_size_mb = output_size / (1024 * 1024)
         elapsed = time.time() - watermark_jobs[job_id]['started_at']
         
         watermark_jobs[job_id]['status'] = 'completed'
@@ -517,11 +1065,12 @@ def _watermark_conversion_worker(job_id, temp_webm, output_path, mp4_filename):
         watermark_jobs[job_id]['message'] = 'Video converted to MP4 successfully'
         watermark_jobs[job_id]['completed_at'] = time.time()
         
-        print(f"[CONVERT] Job {job_id[:8]} SUCCESS: {mp4_filename} ({file_size_mb:.2f}MB) in {elapsed:.1f}s")
+        logger.info(f"[CONVERT] Job {job_id[:8]} SUCCESS: {mp4_filename} ({file_size_mb:.2f}MB) in {elapsed:.1f}s")
         log_event('info', None, f'Conversion {job_id[:8]} complete: {mp4_filename} ({file_size_mb:.2f}MB, {elapsed:.1f}s)')
+        sweep_outputs()
         
     except subprocess.TimeoutExpired:
-        print(f"[CONVERT] Job {job_id[:8]} TIMEOUT (>5min)")
+        logger.error(f"[CONVERT] Job {job_id[:8]} TIMEOUT (>5min)")
         watermark_jobs[job_id]['status'] = 'failed'
         watermark_jobs[job_id]['error'] = 'Conversion timeout'
         watermark_jobs[job_id]['message'] = 'Video took too long to convert (>5min). Try a shorter video.'
@@ -534,9 +1083,8 @@ def _watermark_conversion_worker(job_id, temp_webm, output_path, mp4_filename):
             pass
             
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
-        print(f"[CONVERT] Job {job_id[:8]} EXCEPTION: {error_trace}")
+        logger.error(f"[CONVERT] Job {job_id[:8]} EXCEPTION: {error_trace}")
         
         watermark_jobs[job_id]['status'] = 'failed'
         watermark_jobs[job_id]['error'] = str(e)
@@ -548,17 +1096,24 @@ def _watermark_conversion_worker(job_id, temp_webm, output_path, mp4_filename):
             os.remove(temp_webm)
         except:
             pass
+    
+    finally:
+        # Left behind only by a failed or killed encode
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
 
 
 @app.route('/api/videos/convert-status/<job_id>', methods=['GET'])
 def get_conversion_status(job_id):
     """Poll conversion job status (non-blocking)"""
     if job_id not in watermark_jobs:
-        return jsonify({
+        return ojsonify({
             'error': 'Job not found',
             'job_id': job_id,
             'message': 'Invalid job ID or job expired.'
-        }), 404
+        }, 404)
     
     job = watermark_jobs[job_id]
     
@@ -581,7 +1136,7 @@ def get_conversion_status(job_id):
         if 'exit_code' in job:
             response['exit_code'] = job['exit_code']
     
-    return jsonify(response)
+    return ojsonify(response)
 
 # Stub endpoints removed - focus on core watermarking functionality
 
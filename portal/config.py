@@ -2,6 +2,7 @@
 Portal Configuration
 """
 import os
+import shutil
 
 # Portal paths
 PORTAL_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -18,14 +19,24 @@ TEMP_DIR = os.path.join(PORTAL_ROOT, 'temp')
 # Logs
 LOG_DIR = os.path.join(PORTAL_ROOT, 'logs')
 LOG_FILE = os.path.join(LOG_DIR, 'portal.log')
+LOG_LEVEL = os.environ.get('WTF_LOG_LEVEL', 'INFO').upper()
 
 # Brand assets
 BRANDS_DIR = os.path.join(PROJECT_ROOT, 'imports', 'brands')
 TEMPLATE_DIR = os.path.join(BRANDS_DIR, 'wtf_orchestrator')
 
 # FFmpeg
+# Resolved to absolute paths once, so spawns don't search PATH every time
 FFMPEG_BIN = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+FFMPEG_BIN = shutil.which(FFMPEG_BIN) or FFMPEG_BIN
 FFPROBE_BIN = os.environ.get('FFPROBE_PATH', 'ffprobe')
+FFPROBE_BIN = shutil.which(FFPROBE_BIN) or FFPROBE_BIN
+
+# Download offload to the reverse proxy (both off by default)
+# WTF_X_ACCEL_REDIRECT_PREFIX: nginx internal location mapped to OUTPUT_DIR, e.g. /internal/outputs
+# WTF_USE_X_SENDFILE=1: Apache mod_xsendfile / lighttpd
+X_ACCEL_REDIRECT_PREFIX = os.environ.get('WTF_X_ACCEL_REDIRECT_PREFIX', '')
+USE_X_SENDFILE = os.environ.get('WTF_USE_X_SENDFILE', '') == '1'
 
 # Security
 SECRET_KEY = os.environ.get('WTF_SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -34,7 +45,16 @@ PORTAL_AUTH_KEY = os.environ.get('WTF_PORTAL_KEY', 'WTF_PORTAL_TEST')
 # Job settings
 MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # 500MB
 ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi'}
+WATERMARK_EXTENSIONS = {'webm', 'mp4', 'mov'}
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
 CLEANUP_TEMP_AFTER_HOURS = 24
+MAX_OUTPUT_BYTES = int(os.environ.get('WTF_MAX_OUTPUT_MB', '500')) * 1024 * 1024  # LRU cap on OUTPUT_DIR
+JANITOR_INTERVAL = 300  # seconds between janitor sweeps
+MAX_QUEUED_CONVERSIONS = int(os.environ.get('WTF_MAX_QUEUED_CONVERSIONS', '4'))
+CONVERSION_WORKERS = max(1, int(os.environ.get('WTF_CONVERSION_WORKERS', '1')))  # concurrent FFmpeg conversions
+MAX_CONCURRENT_FFMPEG = max(1, int(os.environ.get('WTF_MAX_CONCURRENT_FFMPEG', '1')))  # concurrent re-encodes (remuxes exempt)
+FFMPEG_THREADS = max(0, int(os.environ.get('WTF_FFMPEG_THREADS', '0')))  # threads per re-encode, 0 = one per visible CPU
+FFMPEG_MAX_MEMORY_MB = max(0, int(os.environ.get('WTF_FFMPEG_MAX_MEMORY_MB', '0')))  # address-space cap per conversion FFmpeg, 0 = none
 
 # Ensure directories exist
 for directory in [UPLOAD_DIR, OUTPUT_DIR, TEMP_DIR, LOG_DIR, os.path.dirname(DB_PATH)]:
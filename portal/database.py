@@ -3,14 +3,35 @@ Database models and initialization
 """
 import sqlite3
 import json
+import logging
+import os
+import threading
+import queue
+import time
+import atexit
 from datetime import datetime
 from .config import DB_PATH
 
+logger = logging.getLogger(__name__)
+
+# One connection per thread (and per process, so forked workers don't inherit one)
+_local = threading.local()
+
+# log_event only enqueues; a background thread writes batches in one transaction
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.2  # seconds to wait for more events before writing a batch
+_log_queue = queue.Queue()
+_log_flusher_pid = None
+_log_flusher_lock = threading.Lock()
+
 def init_db():
     """Initialize database with required tables"""
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
+    # WAL lets status/log readers run alongside writers; the setting persists in the file
+    c.execute('PRAGMA journal_mode=WAL')
+    
     # Jobs table
     c.execute('''
         CREATE TABLE IF NOT EXISTS jobs (
@@ -29,6 +50,9 @@ def init_db():
         )
     ''')
     
+    # Nothing queries jobs by status; drop the index older versions created
+    c.execute('DROP INDEX IF EXISTS idx_jobs_status')
+    
     # Logs table
     c.execute('''
         CREATE TABLE IF NOT EXISTS logs (
@@ -67,30 +91,35 @@ def init_db():
     conn.close()
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Get this thread's database connection (opened on first use and reused)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        _local.conn = conn
+        _local.pid = os.getpid()
     return conn
 
 def create_job(job_id, video_filename, template, aspect_ratio='9:16', metadata=None):
     """Create a new job"""
     conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO jobs (job_id, status, video_filename, template, aspect_ratio, created_at, metadata)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (job_id, 'queued', video_filename, template, aspect_ratio, 
-          datetime.utcnow().isoformat(), json.dumps(metadata or {})))
-    
-    # Add to queue
-    c.execute('''
-        INSERT INTO queue (job_id, added_at)
-        VALUES (?, ?)
-    ''', (job_id, datetime.utcnow().isoformat()))
-    
-    conn.commit()
-    conn.close()
+    with conn:
+        c = conn.cursor()
+        
+        c.execute('''
+            INSERT INTO jobs (job_id, status, video_filename, template, aspect_ratio, created_at, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, 'queued', video_filename, template, aspect_ratio, 
+              datetime.utcnow().isoformat(), json.dumps(metadata or {})))
+        
+        # Add to queue
+        c.execute('''
+            INSERT INTO queue (job_id, added_at)
+            VALUES (?, ?)
+        ''', (job_id, datetime.utcnow().isoformat()))
     
     log_event('info', job_id, f'Job created: {template} template, {aspect_ratio}')
     return job_id
@@ -120,12 +149,10 @@ def update_job_status(job_id, status, output_path=None, error_message=None):
     
     params.append(job_id)
     
-    c.execute(f'''
-        UPDATE jobs SET {', '.join(updates)} WHERE job_id = ?
-    ''', params)
-    
-    conn.commit()
-    conn.close()
+    with conn:
+        c.execute(f'''
+            UPDATE jobs SET {', '.join(updates)} WHERE job_id = ?
+        ''', params)
     
     log_event('info', job_id, f'Status updated: {status}')
 
@@ -135,7 +162,6 @@ def get_job(job_id):
     c = conn.cursor()
     c.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,))
     row = c.fetchone()
-    conn.close()
     return dict(row) if row else None
 
 def get_recent_jobs(limit=20):
@@ -144,58 +170,97 @@ def get_recent_jobs(limit=20):
     c = conn.cursor()
     c.execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,))
     rows = c.fetchall()
-    conn.close()
     return [dict(row) for row in rows]
 
 def log_event(level, job_id, message, details=None):
-    """Log an event"""
+    """Log an event (queued; written by the background log flusher)"""
+    _log_queue.put_nowait((datetime.utcnow().isoformat(), level, job_id, message,
+                           json.dumps(details) if details else None))
+    _ensure_log_flusher()
+
+def flush_logs():
+    """Write any queued log events now"""
+    batch = []
+    while True:
+        try:
+            batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_logs(batch)
+
+def _write_logs(batch):
     conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO logs (timestamp, level, job_id, message, details)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (datetime.utcnow().isoformat(), level, job_id, message, json.dumps(details) if details else None))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.executemany('''
+            INSERT INTO logs (timestamp, level, job_id, message, details)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+
+def _ensure_log_flusher():
+    """Start the log flusher thread if it isn't running in this process"""
+    global _log_flusher_pid
+    if _log_flusher_pid == os.getpid():
+        return
+    with _log_flusher_lock:
+        if _log_flusher_pid != os.getpid():
+            threading.Thread(target=_log_flusher, name='log-flusher', daemon=True).start()
+            _log_flusher_pid = os.getpid()
+
+def _log_flusher():
+    """Collect queued events for up to LOG_FLUSH_INTERVAL and write them as one batch"""
+    while True:
+        batch = [_log_queue.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(batch) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_log_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_logs(batch)
+        except sqlite3.Error as e:
+            logger.error(f"[LOG FLUSH ERROR] Dropped {len(batch)} log events: {e}")
 
 def get_recent_logs(limit=50):
     """Get recent logs"""
+    flush_logs()
     conn = get_db()
     c = conn.cursor()
     c.execute('SELECT * FROM logs ORDER BY timestamp DESC LIMIT ?', (limit,))
     rows = c.fetchall()
-    conn.close()
     return [dict(row) for row in rows]
 
 def get_next_queued_job():
     """Get next job from queue"""
     conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        SELECT q.job_id FROM queue q
-        JOIN jobs j ON q.job_id = j.job_id
-        WHERE q.processing = 0 AND j.status = 'queued'
-        ORDER BY q.priority DESC, q.added_at ASC
-        LIMIT 1
-    ''')
-    row = c.fetchone()
-    
-    if row:
-        job_id = row[0]
-        # Mark as processing
-        c.execute('UPDATE queue SET processing = 1 WHERE job_id = ?', (job_id,))
-        conn.commit()
+    with conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT q.job_id FROM queue q
+            JOIN jobs j ON q.job_id = j.job_id
+            WHERE q.processing = 0 AND j.status = 'queued'
+            ORDER BY q.priority DESC, q.added_at ASC
+            LIMIT 1
+        ''')
+        row = c.fetchone()
+        
+        if row:
+            job_id = row[0]
+            # Mark as processing
+            c.execute('UPDATE queue SET processing = 1 WHERE job_id = ?', (job_id,))
     
-    conn.close()
     return row[0] if row else None
 
 def remove_from_queue(job_id):
     """Remove job from queue"""
     conn = get_db()
-    c = conn.cursor()
-    c.execute('DELETE FROM queue WHERE job_id = ?', (job_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute('DELETE FROM queue WHERE job_id = ?', (job_id,))
 
 # Initialize database on import
 init_db()
+atexit.register(flush_logs)
@@ -0,0 +1,81 @@
+"""
+Disk janitor - keeps OUTPUT_DIR under a byte cap and clears stale temp files
+"""
+import logging
+import os
+import threading
+import time
+from .config import OUTPUT_DIR, TEMP_DIR, MAX_OUTPUT_BYTES, JANITOR_INTERVAL, CLEANUP_TEMP_AFTER_HOURS
+
+logger = logging.getLogger(__name__)
+
+_sweep_lock = threading.Lock()
+_janitor_pid = None
+_janitor_lock = threading.Lock()
+
+def sweep(max_bytes=MAX_OUTPUT_BYTES):
+    """Delete least-recently-used outputs until OUTPUT_DIR fits in max_bytes, and old temp files"""
+    with _sweep_lock:
+        try:
+            freed = _sweep_outputs(max_bytes)
+            _sweep_temp()
+        except OSError as e:
+            logger.error(f"[JANITOR ERROR] Sweep failed: {e}")
+            return 0
+        return freed
+
+def _sweep_outputs(max_bytes):
+    files = []
+    total = 0
+    with os.scandir(OUTPUT_DIR) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            # atime may not be updated (noatime/relatime mounts) - mtime covers fresh writes
+            files.append((max(st.st_atime, st.st_mtime), st.st_size, entry.path))
+            total += st.st_size
+    
+    freed = 0
+    if total > max_bytes:
+        files.sort()
+        for _, size, path in files:
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+        logger.info(f"[JANITOR] Freed {freed / (1024 * 1024):.1f}MB from outputs ({total / (1024 * 1024):.1f}MB kept)")
+    return freed
+
+def _sweep_temp():
+    """Remove staged uploads left behind by crashed or killed jobs"""
+    cutoff = time.time() - CLEANUP_TEMP_AFTER_HOURS * 3600
+    with os.scandir(TEMP_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+def ensure_janitor():
+    """Start the periodic sweep thread if it isn't running in this process"""
+    global _janitor_pid
+    if _janitor_pid == os.getpid():
+        return
+    with _janitor_lock:
+        if _janitor_pid != os.getpid():
+            threading.Thread(target=_janitor_loop, name='janitor', daemon=True).start()
+            _janitor_pid = os.getpid()
+
+def _janitor_loop():
+    while True:
+        sweep()
+        time.sleep(JANITOR_INTERVAL)
@@ -0,0 +1,57 @@
+"""
+Logging setup - portal log records are queued and written by one listener thread
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from .config import LOG_LEVEL
+
+_log_queue = queue.SimpleQueue()
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+class _BatchingStreamHandler(logging.StreamHandler):
+    """StreamHandler that only flushes once the queue is drained, so bursts share a write"""
+
+    def flush(self):
+        if _log_queue.empty():
+            super().flush()
+
+class _ProcessQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that starts the listener in whichever process logs (forked workers included)"""
+
+    def enqueue(self, record):
+        _ensure_listener()
+        super().enqueue(record)
+
+def _ensure_listener():
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            handler = _BatchingStreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _listener = logging.handlers.QueueListener(_log_queue, handler)
+            _listener.start()
+            _listener_pid = os.getpid()
+
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+def setup_logging():
+    """Route the 'portal' logger through the queue (idempotent)"""
+    logger = logging.getLogger('portal')
+    if any(isinstance(h, _ProcessQueueHandler) for h in logger.handlers):
+        return logger
+    logger.addHandler(_ProcessQueueHandler(_log_queue))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    atexit.register(_stop_listener)
+    return logger